@@ -1,141 +1,689 @@
-from dash import Dash, Input, Output, State, ctx
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+
+from dash import Dash, Input, Output, State, ctx, no_update
+from dash.exceptions import PreventUpdate
+from flask import Response
 import numpy as np
-import pandas as pd
-import plotly.express as px
-from ui import create_layout, data
+from clinic_alloc.areas import AreaSet
+from clinic_alloc.datasets import DatasetStore, page, read_upload
+from clinic_alloc.metrics import REGISTRY, SIZE_BUCKETS, Counter, Gauge, Histogram, profile_if_slow
+from clinic_alloc.regions import solve_regions
+from clinic_alloc.solver import (DEFAULT_ENGINE, forced_values, fptas_cells, get_budget_sweep, knapsack_at_resolution,
+                                  knapsack_branch_and_bound, knapsack_fptas, knapsack_multi, solve_budget,
+                                  sweep_stats)
+from ui import MIN_EPSILON, PAGE_SIZE, create_layout, default_areas
 
-app = Dash(__name__, external_stylesheets=['https://cdn.jsdelivr.net/npm/tailwindcss@2.2.19/dist/tailwind.min.css'])
+# (args, kwargs, function) of every Dash callback, registered on each app that create_app builds
+CALLBACKS = []
 
-app.layout = create_layout()
 
+def callback(*args, **kwargs):
+    """Like Dash's app.callback, but only records the callback; create_app registers it."""
+    def decorate(func):
+        CALLBACKS.append((args, kwargs, func))
+        return func
+    return decorate
 
-def knapsack(values, weights, capacity):
-    """Solves the 0/1 Knapsack problem using Dynamic Programming.
-    Time Complexity: O(n * capacity), where n is the number of items and capacity is the maximum weight of the knapsack."""
-    n = len(values)  
-    # Create a 2D DP table where dp[i][w] represents the maximum value attainable 
-    # with the first i items and a weight limit of w
-    dp = np.zeros((n + 1, capacity + 1), dtype=int)
 
-    # Fill the DP table
-    for i in range(1, n + 1):  
-        for w in range(1, capacity + 1): 
-            if weights[i - 1] <= w:  # If the current item's weight is less than or equal to the capacity
-                # Either exclude the item or include it (add its value and subtract its weight)
-                dp[i][w] = max(dp[i - 1][w], dp[i - 1][w - weights[i - 1]] + values[i - 1])
-            else:
-                # If the item's weight is greater than the current capacity, exclude it
-                dp[i][w] = dp[i - 1][w]
-
-    # Trace back the items included in the optimal solution
-    w = capacity 
-    selected = []  # List to store indices of selected items
-    for i in range(n, 0, -1):  
-        if dp[i][w] != dp[i - 1][w]:  # If the value changes, the item was included
-            selected.append(i - 1)  # Add the item's index (adjusted for 0-based indexing)
-            w -= weights[i - 1]  # Reduce the remaining capacity by the item's weight
-
-    return selected  # Return the indices of the selected items
-
-# def knapsack(values, weights, capacity):
-    
-#     n = len(values)
-#     # Call the recursive function with all items
-#     return knapsack_recursive(values, weights, capacity, n)
-
-# def knapsack_recursive(values, weights, capacity, n):
-#     """Solves the 0/1 Knapsack problem using a recursive approach.
-#     Time Complexity: O(2^n), where n is the number of items. This is because the function explores all subsets of items."""
-    
-#     # Base case: no items left or capacity becomes 0
-#     if n == 0 or capacity == 0:
-#         return []
-
-#     # Case 1: If the weight of the nth item is greater than the capacity, we cannot include it
-#     if weights[n - 1] > capacity:
-#         return knapsack_recursive(values, weights, capacity, n - 1)
-
-#     # Case 2: If we include the nth item:
-#     # Recurse with reduced capacity and reduced number of items
-#     include_items = knapsack_recursive(values, weights, capacity - weights[n - 1], n - 1)
-#     include_items = include_items + [n - 1]  # Add current item to the list of selected items
-
-#     # Case 3: If we exclude the nth item:
-#     # Recurse without including the current item
-#     exclude_items = knapsack_recursive(values, weights, capacity, n - 1)
-
-#     # Compare the value of including or excluding the current item
-#     include_value = sum(values[i] for i in include_items)  # Total value if we include the nth item
-#     exclude_value = sum(values[i] for i in exclude_items)  # Total value if we exclude the nth item
-
-#     # Return the better choice (including or excluding the nth item)
-#     if include_value > exclude_value:
-#         return include_items
-#     else:
-#         return exclude_items
-
-
-
-@app.callback(
+def build_budget_curve(sweep, budget):
+    """Line chart of the best population served against the budget, marking the current budget."""
+    # Plotly is imported on the first chart rather than at start-up
+    import plotly.express as px
+
+    budgets, populations = sweep.curve()
+    curve = px.line(
+        x=budgets,
+        y=populations,
+        line_shape="hv",
+        labels={"x": "Budget", "y": "Population Served"},
+        title="Population Served vs. Budget",
+        color_discrete_sequence=px.colors.qualitative.Pastel
+    )
+    curve.add_vline(x=budget, line_dash="dash")
+    return curve
+
+
+class ResultCache:
+    """Content-addressed cache of optimize_allocation results with LRU and TTL eviction.
+    Entries are JSON-serializable callback outputs (NumPy arrays allowed) keyed by a hash of the area set,
+    budget and engine.
+    With a directory, entries are also written there as JSON files so they survive restarts; evicting or
+    expiring an entry deletes its file, and the directory holds at most max_entries files."""
+
+    def __init__(self, max_entries=256, ttl=None, directory=None):
+        self.max_entries = max_entries
+        self.ttl = ttl  # Seconds an entry stays valid, or None to keep it until evicted
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (stored_at, result)
+        self._files = OrderedDict()  # keys with a file in directory, least recently used first
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            # Files left by earlier runs count against max_entries too, oldest first
+            paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".json")]
+            for path in sorted(paths, key=os.path.getmtime):
+                self._files[os.path.basename(path)[:-len(".json")]] = None
+            self._evict()
+
+    @staticmethod
+    def make_key(areas, budget, engine):
+        """Hashes the AreaSet's columns (typed, so 100 and 100.0 match), the budget and the engine."""
+        if isinstance(budget, float) and budget.is_integer():
+            budget = int(budget)
+        payload = json.dumps([areas.fingerprint(), budget, engine])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key):
+        """Returns the cached result for key, or None when it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and key in self._files:
+                entry = self._load(key)
+            if entry is not None and self.ttl is not None and time.time() - entry[0] > self.ttl:
+                self._discard(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            if key in self._files:
+                self._files.move_to_end(key)
+            self._evict()
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, result):
+        """Stores a JSON-serializable result under key."""
+        entry = (time.time(), result)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            if self.directory:
+                path = os.path.join(self.directory, key + ".json")
+                with open(path + ".tmp", "w") as f:
+                    json.dump({"stored_at": entry[0], "result": result}, f, default=lambda o: o.tolist())
+                os.replace(path + ".tmp", path)
+                self._files[key] = None
+                self._files.move_to_end(key)
+            self._evict()
+
+    def stats(self):
+        """Hit/miss counters and the number of entries held in memory."""
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries),
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+    def _load(self, key):
+        try:
+            with open(os.path.join(self.directory, key + ".json")) as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            self._discard(key)
+            return None
+        return stored["stored_at"], stored["result"]
+
+    def _discard(self, key):
+        """Drops an entry from memory and deletes its file."""
+        self._entries.pop(key, None)
+        if self._files.pop(key, False) is not False:
+            try:
+                os.remove(os.path.join(self.directory, key + ".json"))
+            except OSError:
+                pass
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._discard(next(iter(self._entries)))
+        while len(self._files) > self.max_entries:
+            self._discard(next(iter(self._files)))
+
+
+# Results of recent optimize clicks; set CLINIC_ALLOC_CACHE_DIR to keep them on disk across restarts
+RESULT_CACHE_SIZE = 256
+RESULT_CACHE_TTL = 24 * 60 * 60
+result_cache = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL, os.environ.get("CLINIC_ALLOC_CACHE_DIR"))
+
+
+class JobCancelled(Exception):
+    """Raised inside a background job once it has been cancelled or superseded."""
+
+
+class OptimizationJob:
+    """State of one background optimization, shared by its worker thread and the polling callback."""
+
+    def __init__(self, args=()):
+        self.args = args  # Arguments the job was started with
+        self.rows_done = 0
+        self.rows_total = 0
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+        self.cancelled = threading.Event()
+
+    def progress(self, rows_done, rows_total):
+        """Progress hook handed to the solver; aborts the solve at the next DP row once cancelled."""
+        if self.cancelled.is_set():
+            raise JobCancelled()
+        self.rows_done, self.rows_total = rows_done, rows_total
+
+
+class JobManager:
+    """Runs optimizations on a local thread pool, keeping one current job per browser session.
+    Submitting a job cancels the one it supersedes, so stale solves stop burning CPU at their next row.
+    Threads are used rather than processes so that jobs share the sweep sessions and the result cache."""
+
+    def __init__(self, max_workers=2):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="optimize")
+        self._jobs = {}  # session id -> current OptimizationJob
+        self._lock = threading.Lock()
+
+    def submit(self, session_id, fn, *args):
+        """Starts fn(*args, progress=...) as the session's current job, cancelling its previous one."""
+        job = OptimizationJob(args)
+        with self._lock:
+            previous = self._jobs.get(session_id)
+            if previous is not None:
+                previous.cancelled.set()
+            self._jobs[session_id] = job
+        self._executor.submit(self._run, job, fn, args)
+        return job
+
+    def current(self, session_id):
+        """The session's current job, or None."""
+        with self._lock:
+            return self._jobs.get(session_id)
+
+    def cancel(self, session_id):
+        """Cancels the session's current job and returns it, or None if there is none."""
+        job = self.current(session_id)
+        if job is not None:
+            job.cancelled.set()
+        return job
+
+    def finish(self, session_id, job):
+        """Forgets a job once its outcome has been delivered, unless it was already superseded."""
+        with self._lock:
+            if self._jobs.get(session_id) is job:
+                del self._jobs[session_id]
+
+    @staticmethod
+    def _run(job, fn, args):
+        outcome = "cancelled"
+        try:
+            if not job.cancelled.is_set():
+                job.result = fn(*args, progress=job.progress)
+                outcome = "completed"
+        except JobCancelled:
+            pass
+        except Exception as e:
+            job.error = e
+            outcome = "failed"
+        finally:
+            BACKGROUND_JOBS.inc(outcome=outcome)
+            job.done.set()
+
+
+# Problems with more than this many areas x budget units (or approximation DP cells) are solved in the background
+BACKGROUND_MIN_CELLS = 2_000_000
+# Approximations needing more DP cells than this (see fptas_cells) are refused; a larger tolerance needs fewer
+FPTAS_CELL_LIMIT = 500_000_000
+BACKGROUND_WORKERS = 2
+job_manager = JobManager(BACKGROUND_WORKERS)
+
+
+STAGE_SECONDS = Histogram("clinic_alloc_stage_seconds", "Time spent in each stage of an optimization.",
+                          labelnames=("stage",))
+CALLBACK_SECONDS = Histogram("clinic_alloc_callback_seconds", "Latency of each Dash callback.",
+                             labelnames=("callback",))
+PROBLEM_AREAS = Histogram("clinic_alloc_problem_areas", "Number of areas per optimization.", buckets=SIZE_BUCKETS)
+PROBLEM_BUDGET = Histogram("clinic_alloc_problem_budget", "Budget per optimization.", buckets=SIZE_BUCKETS)
+DP_TABLE_CELLS = Histogram("clinic_alloc_dp_table_cells", "Areas x reduced budget columns of each DP solve.",
+                           buckets=SIZE_BUCKETS)
+BACKGROUND_JOBS = Counter("clinic_alloc_background_jobs_total", "Background optimizations by outcome.",
+                          labelnames=("outcome",))
+Gauge("clinic_alloc_result_cache_hits", "Result cache hits since start.", function=lambda: result_cache.hits)
+Gauge("clinic_alloc_result_cache_misses", "Result cache misses since start.", function=lambda: result_cache.misses)
+Gauge("clinic_alloc_result_cache_hit_ratio", "Result cache hits / lookups.", function=lambda: result_cache.stats()["hit_rate"])
+Gauge("clinic_alloc_result_cache_entries", "Results held in memory.", function=lambda: result_cache.stats()["entries"])
+Gauge("clinic_alloc_sweep_sessions", "Budget sweep sessions held in memory.", function=lambda: sweep_stats()["sessions"])
+Gauge("clinic_alloc_sweep_bytes", "Memory held by budget sweep sessions.", function=lambda: sweep_stats()["bytes"])
+
+# Set CLINIC_ALLOC_PROFILE_DIR to keep a cProfile dump of every optimization slower than the threshold
+PROFILE_DIR = os.environ.get("CLINIC_ALLOC_PROFILE_DIR")
+PROFILE_THRESHOLD = float(os.environ.get("CLINIC_ALLOC_PROFILE_THRESHOLD", "1.0"))
+
+
+def instrumented(name):
+    """Records the decorated callback's latency in CALLBACK_SECONDS under the given name."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with CALLBACK_SECONDS.time(callback=name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def metrics():
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+# Seconds an optimize click may spend in branch and bound before returning its best solution so far
+BRANCH_AND_BOUND_TIME_LIMIT = 5.0
+
+
+@callback(
     Output("add-area-modal", "style"),
     [Input("add-area-button", "n_clicks"), Input("cancel-new-area", "n_clicks")]
 )
+@instrumented("toggle_add_area_modal")
 def toggle_add_area_modal(add_clicks, cancel_clicks):
     if ctx.triggered_id == "add-area-button":
         return {"display": "block", "padding": "10px", "border": "1px solid #4CAF50", "borderRadius": "5px", "backgroundColor": "grey-800", "marginTop": "35px"}
     return {"display": "none"}
 
 
-@app.callback(
+# Area tables and result tables live on the server, one per browser session
+datasets = DatasetStore(default_areas)
+Gauge("clinic_alloc_dataset_sessions", "Sessions holding a server-side area table",
+      function=lambda: datasets.stats()["sessions"])
+
+
+@callback(
     Output("input-table", "data"),
+    Output("input-table", "page_count"),
+    Input("dataset-version", "data"),
+    Input("input-table", "page_current"),
+    Input("input-table", "sort_by"),
+    Input("input-table", "filter_query"),
+    State("input-table", "page_size"),
+    State("session-id", "data")
+)
+@instrumented("render_input_page")
+def render_input_page(version, page_current, sort_by, filter_query, page_size, session_id):
+    return page(datasets.table(session_id), page_current, page_size or PAGE_SIZE, sort_by, filter_query)
+
+
+@callback(
+    Output("dataset-version", "data"),
+    Input("input-table", "data_timestamp"),
+    State("input-table", "data"),
+    State("input-table", "data_previous"),
+    State("session-id", "data"),
+    prevent_initial_call=True
+)
+@instrumented("save_input_edits")
+def save_input_edits(timestamp, page_data, previous, session_id):
+    # Only the visible page comes back from the browser; the rows that differ are written to the store
+    if not page_data or not previous or len(page_data) != len(previous):
+        raise PreventUpdate
+    edited = [row for row, before in zip(page_data, previous) if row != before]
+    if not edited:
+        raise PreventUpdate
+    return datasets.update_rows(session_id, edited)
+
+
+@callback(
+    Output("dataset-version", "data", allow_duplicate=True),
     [Input("submit-new-area", "n_clicks")],
-    [State("input-table", "data"),
-     State("new-area-name", "value"),
+    [State("new-area-name", "value"),
      State("new-area-population", "value"),
-     State("new-area-cost", "value")]
+     State("new-area-cost", "value"),
+     State("session-id", "data")],
+    prevent_initial_call=True
 )
-def add_new_area(n_clicks, table_data, area_name, population, cost):
+@instrumented("add_new_area")
+def add_new_area(n_clicks, area_name, population, cost, session_id):
     if n_clicks > 0 and area_name and population and cost:
-        new_row = {"Area": area_name, "Population": population, "Cost": cost}
-        table_data.append(new_row)
-    return table_data
+        new_row = {"Area": area_name, "Population": population, "Cost": cost, "Max Clinics": 1,
+                   "Doctors": 0, "Equipment": 0}
+        return datasets.append(session_id, new_row)
+    raise PreventUpdate
 
 
-@app.callback(
-    [Output("output-table", "data"), Output("population-chart", "figure"), Output("total-selected-population", "children")],
-    Input("optimize-button", "n_clicks"),
-    State("input-table", "data"),
-    State("budget-input", "value")
+@callback(
+    Output("dataset-version", "data", allow_duplicate=True),
+    Output("upload-status", "children"),
+    Input("upload-areas", "contents"),
+    State("upload-areas", "filename"),
+    State("session-id", "data"),
+    prevent_initial_call=True
+)
+@instrumented("upload_areas")
+def upload_areas(contents, filename, session_id):
+    try:
+        table = read_upload(contents, filename)
+    except ValueError as e:
+        return no_update, f"Import failed: {e}"
+    return datasets.replace(session_id, table), f"Imported {len(table)} areas from {filename}"
+
+
+@callback(
+    Output("output-table", "data"),
+    Output("output-table", "page_count"),
+    Input("results-version", "data"),
+    Input("output-table", "page_current"),
+    Input("output-table", "sort_by"),
+    Input("output-table", "filter_query"),
+    State("output-table", "page_size"),
+    State("session-id", "data")
 )
-def optimize_allocation(n_clicks, input_data, budget):
-    if n_clicks == 0 or not input_data or budget is None:
-        return [], {}, "Total Selected Population: 0"
+@instrumented("render_output_page")
+def render_output_page(version, page_current, sort_by, filter_query, page_size, session_id):
+    return page(datasets.results(session_id), page_current, page_size or PAGE_SIZE, sort_by, filter_query)
 
-    df = pd.DataFrame(input_data)
-    populations = df["Population"].tolist()
-    costs = df["Cost"].tolist()
 
-    selected_indices = knapsack(populations, costs, budget)
-    df["Status"] = ["Selected" if i in selected_indices else "Not Selected" for i in range(len(df))]
+OPTIMIZE_OUTPUTS = [Output("results-version", "data"), Output("population-chart", "figure"),
+                    Output("total-selected-population", "children"), Output("budget-curve-chart", "figure"),
+                    Output("region-table", "data")]
 
-    
+
+def parse_region_caps(text):
+    """Parses "Cairo=200, Giza=150" into {"Cairo": 200, "Giza": 150}; blank text means no caps."""
+    caps = {}
+    for part in (text or "").split(","):
+        if not part.strip():
+            continue
+        region, sep, cap = part.rpartition("=")
+        if not sep or not region.strip():
+            raise ValueError(f"expected Region=cap, got {part.strip()!r}")
+        caps[region.strip()] = float(cap) if "." in cap else int(cap)
+    return caps
+
+
+def solve_allocation(table, budget, resolution, limits=None, region_caps=None, epsilon=None, sensitivity=False,
+                     cached_only=False, progress=None):
+    """Runs one optimization over an area table (a DataFrame) and returns the OPTIMIZE_OUTPUTS values,
+    JSON-serializable so they can be cached, with the solution columns in place of the results version
+    (see publish_result).
+    limits maps resource columns (Doctors, Equipment) to their capacity; None or missing means unlimited.
+    With region_caps (a dict, possibly empty) the budget is split between the areas' regions by solve_regions,
+    each region spending at most its cap.
+    With epsilon (MIN_EPSILON <= epsilon < 1) the areas are chosen by knapsack_fptas, serving at least
+    (1 - epsilon) times the optimal population in time independent of the budget; a tolerance whose DP
+    would exceed FPTAS_CELL_LIMIT cells is refused.
+    With sensitivity, the exact single-budget solve also reports each area's "Loss If Flipped" (see
+    forced_values), the population lost by forcing a selected area out or an unselected one in.
+    With cached_only, the budget is only answered from a cached sweep (PreventUpdate otherwise).
+    progress(rows_done, n) is passed on to the solver. Each stage is timed in STAGE_SECONDS, and with
+    CLINIC_ALLOC_PROFILE_DIR set, calls slower than PROFILE_THRESHOLD seconds leave a cProfile dump."""
+    with profile_if_slow(PROFILE_DIR, PROFILE_THRESHOLD, "optimize"):
+        return _solve_allocation(table, budget, resolution, limits, region_caps, epsilon, sensitivity, cached_only,
+                                 progress)
+
+
+def _solve_allocation(table, budget, resolution, limits, region_caps, epsilon, sensitivity, cached_only, progress):
+    limits = {column: limit for column, limit in (limits or {}).items() if limit is not None}
+    if limits and region_caps is not None:
+        return [{}, {}, "Splitting the budget by region does not support doctor or equipment limits", {}, []]
+    if epsilon is not None:
+        if not MIN_EPSILON <= epsilon < 1:
+            return [{}, {}, f"The tolerance must be at least {MIN_EPSILON:g} and below 1", {}, []]
+        if limits or region_caps is not None or (resolution and resolution > 1):
+            return [{}, {}, "The tolerance cannot be combined with resource limits, regions or a cost resolution",
+                    {}, []]
+    if sensitivity and (epsilon is not None or limits or region_caps is not None or (resolution and resolution > 1)):
+        return [{}, {}, "Sensitivity analysis needs the exact solve with only a budget", {}, []]
+    engine = f"{DEFAULT_ENGINE}@{int(resolution)}" if resolution and resolution > 1 else DEFAULT_ENGINE
+    if epsilon is not None:
+        engine = f"fptas@{epsilon:g}"
+    elif limits:
+        engine = "multi:" + ",".join(f"{column}={limit}" for column, limit in sorted(limits.items()))
+    elif region_caps is not None:
+        engine = "regions:" + ",".join(f"{region}={cap}" for region, cap in sorted(region_caps.items()))
+    if sensitivity:
+        engine += "+sensitivity"
+
+    with STAGE_SECONDS.time(stage="areas"):
+        try:
+            areas = AreaSet.from_table(table)
+        except (TypeError, ValueError) as e:
+            return [{}, {}, f"Invalid areas table: {e}", {}, []]
+    with STAGE_SECONDS.time(stage="cache_lookup"):
+        cache_key = ResultCache.make_key(areas, budget, engine)
+        cached = result_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    PROBLEM_AREAS.observe(len(areas))
+    PROBLEM_BUDGET.observe(budget)
+
+    gap = None
+    sweep = None
+    budget_curve = {}
+    region_rows = []
+    with STAGE_SECONDS.time(stage="solve"):
+        try:
+            # Areas allowed several clinics become O(log count) 0/1 items; single-clinic areas stay one item each
+            populations, costs, owners, units = areas.split()
+        except ValueError as e:
+            return [{}, {}, f"Invalid areas table: {e}", {}, []]
+        if epsilon is not None:
+            cells = fptas_cells(populations, costs, budget, epsilon)
+            if cells > FPTAS_CELL_LIMIT:
+                return [{}, {}, f"The tolerance {epsilon:g} needs {cells} DP cells for these areas, more than "
+                                f"{FPTAS_CELL_LIMIT}; use a larger one", {}, []]
+            selected_indices, gap = knapsack_fptas(populations, costs, budget, epsilon, progress)
+        elif cached_only:
+            # Budget edits are answered from the cached sweep only; anything else waits for a click
+            if limits or region_caps is not None or (resolution and resolution > 1) or sensitivity:
+                raise PreventUpdate
+            sweep = get_budget_sweep(populations, costs, budget, build=False)
+            if sweep is None:
+                raise PreventUpdate
+            selected_indices = sweep.selection(budget)
+            budget_curve = json.loads(build_budget_curve(sweep, budget).to_json())
+        elif limits:
+            # Each split item uses its area's per-clinic resources times the clinics it stands for
+            no_usage = np.zeros(len(areas), dtype=np.int64)
+            weights = np.column_stack([costs] + [areas.resources.get(column, no_usage)[owners] * units
+                                                 for column in limits])
+            selected_indices, gap = knapsack_multi(populations, weights, (budget,) + tuple(limits.values()))
+        elif region_caps is not None:
+            try:
+                plan = solve_regions(populations, costs, areas.regions[owners], budget, region_caps,
+                                     progress=progress)
+            except ValueError as e:
+                return [{}, {}, f"Invalid areas table: {e}", {}, []]
+            selected_indices, gap = plan.selected, plan.gap
+            budget_curve = json.loads(build_budget_curve(plan, budget).to_json())
+            region_rows = [{"Region": r["region"], "Cap": r["cap"], "Budget": r["budget"],
+                            "Clinics": int(units[r["selected"]].sum()),
+                            "Population Served": r["population"], "Cost": r["cost"]} for r in plan.regions]
+        elif resolution and resolution > 1:
+            selected_indices, gap = knapsack_at_resolution(populations, costs, budget, int(resolution))
+        elif costs.dtype.kind == "f":
+            if sensitivity:
+                return [{}, {}, "Sensitivity analysis needs whole-number costs", {}, []]
+            selected_indices, gap = knapsack_branch_and_bound(populations, costs, budget, time_limit=BRANCH_AND_BOUND_TIME_LIMIT)
+        else:
+            selected_indices, sweep = solve_budget(populations, costs, budget, progress)
+            if sweep is not None:
+                budget_curve = json.loads(build_budget_curve(sweep, budget).to_json())
+            else:
+                DP_TABLE_CELLS.observe(len(populations) * (int(budget) // (int(np.gcd.reduce(costs)) or 1) + 1))
+    if sweep is not None:
+        DP_TABLE_CELLS.observe(len(populations) * len(sweep.row))
+
+    with STAGE_SECONDS.time(stage="status"):
+        areas.assign(selected_indices, populations, owners, units)
+    if sensitivity:
+        # One forward and one backward pass answer "forced in" and "forced out" for every area together
+        with STAGE_SECONDS.time(stage="sensitivity"):
+            areas.assign_sensitivity(*forced_values(populations, costs, budget, owners, progress), owners)
 
     # Create Pie Chart
-    selected_df = df[df["Status"] == "Selected"]
-    pie_chart = px.pie(
-        selected_df,
-        values="Population",
-        names="Area",
-        title="Contribution to Total Population Served",
-        color_discrete_sequence=px.colors.qualitative.Pastel
-    )
-    
+    with STAGE_SECONDS.time(stage="figure"):
+        pie_chart = areas.pie_figure()
+
     # Calculate Total Selected Population
-    total_population = sum(row["Population"] for row in df.to_dict("records") if row["Status"] == "Selected")
-    
+    with STAGE_SECONDS.time(stage="total"):
+        total_population = areas.total_population
+
+    total_text = f"Total Selected Population: {total_population}"
+    if epsilon is not None:
+        total_text += f" (approximate within ε={epsilon:g}, at most {gap:g} below optimal)"
+    elif limits:
+        if gap:
+            total_text += f" (heuristic, at most {gap:g} below optimal)"
+    elif region_caps is not None:
+        if gap:
+            total_text += f" (budget split in steps, at most {gap} below optimal)"
+    elif gap is not None and resolution and resolution > 1:
+        total_text += f" (at most {gap} below optimal at cost resolution {int(resolution)})"
+    elif gap:
+        total_text += f" (search stopped early, at most {gap:g} below optimal)"
+
+    with STAGE_SECONDS.time(stage="serialize"):
+        solution = {"Clinics": areas.clinics, "Population Served": areas.served}
+        if areas.flip_loss is not None:
+            solution["Loss If Flipped"] = areas.flip_loss
+        result = [solution, json.loads(pie_chart.to_json()), total_text, budget_curve, region_rows]
+    # A search cut short by its time limit may do better next time, so it is not cached
+    stopped_early = (gap and epsilon is None and not limits and region_caps is None
+                     and not (resolution and resolution > 1))
+    if not stopped_early:
+        result_cache.put(cache_key, result)
+    return result
+
+
+def approximation_cells(table, budget, epsilon):
+    """fptas_cells for an area table, or 0 when the table or tolerance is invalid (solve_allocation says why)."""
+    if not MIN_EPSILON <= epsilon < 1:
+        return 0
+    try:
+        populations, costs = AreaSet.from_table(table).split()[:2]
+    except (TypeError, ValueError):
+        return 0
+    return fptas_cells(populations, costs, budget, epsilon)
+
+
+def publish_result(session_id, table, result):
+    """Joins a result's solution columns to the area table it was solved for and keeps that on the server
+    for render_output_page. Returns the callback outputs, which carry only the new results version."""
+    solution, results = result[0], None
+    if solution:
+        clinics = np.asarray(solution["Clinics"])
+        results = table.assign(**solution, Status=np.where(clinics > 0, "Selected", "Not Selected"))
+    return [datasets.publish(session_id, results)] + result[1:]
+
+
+@callback(
+    OPTIMIZE_OUTPUTS + [Output("optimize-poll", "disabled"), Output("optimize-progress", "children")],
+    Input("optimize-button", "n_clicks"),
+    Input("budget-input", "value"),
+    State("cost-resolution-input", "value"),
+    State("epsilon-input", "value"),
+    State("doctors-input", "value"),
+    State("equipment-input", "value"),
+    State("region-mode-input", "value"),
+    State("region-caps-input", "value"),
+    State("sensitivity-input", "value"),
+    State("session-id", "data")
+)
+@instrumented("optimize_allocation")
+def optimize_allocation(n_clicks, budget, resolution, epsilon, doctors, equipment, region_mode, caps_text, analysis,
+                        session_id):
+    def supersede():
+        # A result shown by this request replaces whatever the session's running job would deliver, so stop
+        # that job instead of letting it finish unseen. A request that shows nothing (PreventUpdate) leaves it be.
+        job = job_manager.cancel(session_id)
+        if job is not None:
+            job_manager.finish(session_id, job)
+
+    def answer(result):
+        supersede()
+        return publish_result(session_id, table, result) + [True, ""]
+
+    table = datasets.table(session_id)
+    if n_clicks == 0 or not len(table) or budget is None:
+        supersede()
+        return no_update, {}, "Total Selected Population: 0", {}, [], True, ""
+
+    limits = {"Doctors": doctors, "Equipment": equipment}
+    epsilon = epsilon or None  # A tolerance of 0 asks for the exact optimum
+    sensitivity = "sensitivity" in (analysis or [])
+    region_caps = None
+    if "regions" in (region_mode or []):
+        try:
+            region_caps = parse_region_caps(caps_text)
+        except ValueError as e:
+            return answer([{}, {}, f"Invalid region caps: {e}", {}, []])
+    if ctx.triggered_id == "budget-input" and epsilon is None:
+        return answer(solve_allocation(table, budget, resolution, limits, region_caps, sensitivity=sensitivity,
+                                       cached_only=True))
+    # The approximation does not grow with the budget, but its DP grows with 1 / epsilon^2; one over
+    # FPTAS_CELL_LIMIT is refused straight away
+    cells = approximation_cells(table, budget, epsilon) if epsilon is not None else len(table) * budget
+    if cells <= BACKGROUND_MIN_CELLS or (epsilon is not None and cells > FPTAS_CELL_LIMIT):
+        return answer(solve_allocation(table, budget, resolution, limits, region_caps, epsilon, sensitivity))
+
+    # Larger problems run in the background, replacing the session's previous job; poll_optimization
+    # delivers the result
+    job_manager.submit(session_id, solve_allocation, table, budget, resolution, limits, region_caps, epsilon,
+                       sensitivity)
+    return [no_update] * len(OPTIMIZE_OUTPUTS) + [False, "Optimizing..."]
+
+
+@callback(
+    [Output(o.component_id, o.component_property, allow_duplicate=True) for o in OPTIMIZE_OUTPUTS] +
+    [Output("optimize-poll", "disabled", allow_duplicate=True), Output("optimize-progress", "children", allow_duplicate=True)],
+    Input("optimize-poll", "n_intervals"),
+    State("session-id", "data"),
+    prevent_initial_call=True
+)
+@instrumented("poll_optimization")
+def poll_optimization(n_intervals, session_id):
+    job = job_manager.current(session_id)
+    if job is None:
+        return [no_update] * len(OPTIMIZE_OUTPUTS) + [True, no_update]
+    if not job.done.is_set():
+        status = f"Optimizing: {job.rows_done} / {job.rows_total} areas" if job.rows_total else "Optimizing..."
+        return [no_update] * len(OPTIMIZE_OUTPUTS) + [False, status]
+
+    job_manager.finish(session_id, job)
+    if job.error is not None:
+        return [no_update] * len(OPTIMIZE_OUTPUTS) + [True, f"Optimization failed: {job.error}"]
+    if job.result is None:
+        return [no_update] * len(OPTIMIZE_OUTPUTS) + [True, "Optimization cancelled"]
+    # The job's first argument is the area table it solved, which may have been edited since
+    return publish_result(session_id, job.args[0], job.result) + [True, ""]
+
+
+@callback(
+    Output("optimize-progress", "children", allow_duplicate=True),
+    Input("cancel-optimize-button", "n_clicks"),
+    State("session-id", "data"),
+    prevent_initial_call=True
+)
+@instrumented("cancel_optimization")
+def cancel_optimization(n_clicks, session_id):
+    if job_manager.cancel(session_id) is None:
+        return no_update
+    return "Cancelling..."
+
 
-    return df.to_dict("records"), pie_chart, f"Total Selected Population: {total_population}"
+def create_app():
+    """Builds the Dash app: layout, callbacks and the /metrics route. The app is a WSGI application, so
+    servers can call the factory in each worker, e.g. gunicorn -w 4 "app:create_app()".
+    Stylesheets (Tailwind included) are served from the local assets/ folder."""
+    app = Dash(__name__)
+    # A function layout is rebuilt on every page load, giving each browser session its own id
+    app.layout = create_layout
+    for args, kwargs, func in CALLBACKS:
+        app.callback(*args, **kwargs)(func)
+    app.server.add_url_rule("/metrics", view_func=metrics)
+    return app
 
 
 if __name__ == "__main__":
-    app.run_server(debug=False)
+    create_app().run(debug=False)
@@ -0,0 +1,8 @@
+"""Clinic allocation as a 0/1 knapsack: areas are items, populations are values, costs are weights."""
+from clinic_alloc.solver import (DEFAULT_ENGINE, ENGINES, BudgetSweep, forced_values, fptas_cells, get_budget_sweep, knapsack,
+                                 knapsack_at_resolution, knapsack_bounded, knapsack_branch_and_bound, knapsack_fptas,
+                                 knapsack_multi, reduce_costs, solve_budget, split_bounded)
+
+__all__ = ["DEFAULT_ENGINE", "ENGINES", "BudgetSweep", "forced_values", "fptas_cells", "get_budget_sweep", "knapsack",
+           "knapsack_at_resolution", "knapsack_bounded", "knapsack_branch_and_bound", "knapsack_fptas",
+           "knapsack_multi", "reduce_costs", "solve_budget", "split_bounded"]
@@ -0,0 +1,131 @@
+"""Typed, columnar area set shared by the solver, the statistics and the rendering.
+
+An AreaSet holds one contiguous NumPy array per column: int64 populations, int64 (or float64, when some
+cost is fractional) costs, categorical names and regions as integer codes into their labels, and after
+a solve a boolean selection mask with the clinics and population served per area. Only NumPy is needed,
+and Plotly for pie_figure.
+"""
+import hashlib
+
+import numpy as np
+
+from clinic_alloc.solver import clinic_counts, split_bounded
+
+# Label given to areas without a region
+UNASSIGNED = "Unassigned"
+# Per-clinic resource columns that may be limited next to the budget
+RESOURCE_COLUMNS = ("Doctors", "Equipment")
+
+
+def _categorical(column, missing):
+    """(labels, codes) of a text column, where labels[codes] gives the values back; None and NaN entries
+    get the label missing."""
+    values = np.asarray(column, dtype=object)
+    values = np.where((values == values) & (values != None), values, missing)  # noqa: E711 (elementwise)
+    labels, codes = np.unique(values.astype(str), return_inverse=True)
+    return labels, codes
+
+
+def _numbers(column, default):
+    """column as an int64 array when every value is a whole number, float64 otherwise; NaN entries take
+    default (a scalar or a per-area array)."""
+    values = np.asarray(column)
+    if values.dtype.kind in "iu":
+        return values.astype(np.int64, copy=False)
+    values = values.astype(np.float64)
+    values = np.where(np.isnan(values), default, values)
+    return values.astype(np.int64) if np.all(values == np.floor(values)) else values
+
+
+class AreaSet:
+    """Areas as typed column arrays, built once per request with from_table.
+    population, cost, max_clinics, marginal and resources[column] are per-area arrays; name_labels[name_codes]
+    and region_labels[region_codes] are the names and regions. After assign(), selected is the boolean
+    mask of areas that got a clinic, clinics the clinics per area and served the population each serves.
+    After assign_sensitivity(), flip_loss is the population the best plan loses when an area's status is
+    forced the other way (NaN where that is impossible)."""
+
+    def __init__(self, names, population, cost, max_clinics=None, marginal=None, resources=None, regions=None):
+        n = len(population)
+        self.name_labels, self.name_codes = _categorical(names, "")
+        self.population = _numbers(population, 0)
+        self.cost = _numbers(cost, np.nan)
+        if self.cost.dtype.kind == "f" and np.isnan(self.cost).any():
+            # A cleared Cost cell must not make an area free
+            raise ValueError(f"area {str(self.names[np.isnan(self.cost).argmax()])!r} has no cost")
+        self.max_clinics = _numbers(max_clinics, 1) if max_clinics is not None else np.ones(n, dtype=np.int64)
+        # A blank marginal population means extra clinics serve as many people as the first
+        self.marginal = _numbers(marginal, self.population) if marginal is not None else self.population
+        self.resources = {column: _numbers(values, 0) for column, values in (resources or {}).items()}
+        self.region_labels, self.region_codes = _categorical(regions if regions is not None else [None] * n, UNASSIGNED)
+        self.selected = np.zeros(n, dtype=bool)
+        self.clinics = np.zeros(n, dtype=np.int64)
+        self.served = np.zeros(n, dtype=self.population.dtype)
+        self.flip_loss = None
+
+    @classmethod
+    def from_table(cls, table):
+        """Builds an AreaSet from a DataFrame (or a dict of columns) with the app's column names."""
+        def column(name):
+            return table[name] if name in table else None
+        return cls(table["Area"], table["Population"], table["Cost"], column("Max Clinics"),
+                   column("Marginal Population"),
+                   {name: table[name] for name in RESOURCE_COLUMNS if name in table}, column("Region"))
+
+    def __len__(self):
+        return len(self.population)
+
+    @property
+    def names(self):
+        return self.name_labels[self.name_codes]
+
+    @property
+    def regions(self):
+        return self.region_labels[self.region_codes]
+
+    def fingerprint(self):
+        """Hex digest of every column the solve reads, for result caching."""
+        digest = hashlib.sha256()
+        for array in (self.name_codes, self.population, self.cost, self.max_clinics, self.marginal, self.region_codes,
+                      *(self.resources[c] for c in sorted(self.resources))):
+            digest.update(array.dtype.str.encode())
+            digest.update(np.ascontiguousarray(array).tobytes())
+        for labels in (self.name_labels, self.region_labels, sorted(self.resources)):
+            digest.update("\0".join(labels).encode() + b"\1")
+        return digest.hexdigest()
+
+    def split(self):
+        """The 0/1 items of split_bounded for these areas: (item_values, item_weights, owners, units)."""
+        return split_bounded(self.population, self.cost, self.max_clinics, self.marginal)
+
+    def assign(self, selected_items, item_values, owners, units):
+        """Records a solve's selected items as the clinics, served population and selection mask per area."""
+        items = np.asarray(selected_items, dtype=np.intp)
+        self.clinics = clinic_counts(items, owners, units, len(self))
+        self.served = np.bincount(owners[items], weights=item_values[items], minlength=len(self)).astype(item_values.dtype)
+        self.selected = self.clinics > 0
+
+    def assign_sensitivity(self, forced_in, forced_out, owners):
+        """Records flip_loss from forced_values run over the split items (one entry per area with items)."""
+        present = np.unique(owners)
+        best_in = np.full(len(self), -1, dtype=forced_in.dtype)
+        best_out = np.full(len(self), -1, dtype=forced_out.dtype)
+        best_in[present], best_out[present] = forced_in, forced_out
+        optimum = max(best_in.max(initial=0), best_out.max(initial=0))
+        flipped = np.where(self.selected, best_out, best_in)
+        self.flip_loss = np.where(flipped >= 0, optimum - flipped, np.nan)
+
+    @property
+    def total_population(self):
+        return self.served.sum()
+
+    def pie_figure(self):
+        """Pie chart of the population served by each selected area, as the app shows it."""
+        import plotly.express as px
+
+        return px.pie(
+            values=self.served[self.selected],
+            names=self.names[self.selected],
+            title="Contribution to Total Population Served",
+            color_discrete_sequence=px.colors.qualitative.Pastel
+        )
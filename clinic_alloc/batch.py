@@ -0,0 +1,168 @@
+"""Headless batch runner: streams many allocation scenarios through a process pool.
+
+    python -m clinic_alloc.batch scenarios.csv -o results.csv [--workers N] [--engine auto]
+
+The input (CSV or Parquet) has one row per area with the columns scenario, region, budget, area,
+population and cost; the rows of a scenario must be contiguous. Scenarios are read one at a time and
+results are written as they complete, in input order, so neither side is held in memory. Only the
+solver is imported, never Dash or Plotly.
+"""
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import os
+import sys
+
+from clinic_alloc.solver import DEFAULT_ENGINE, ENGINES, knapsack
+
+INPUT_COLUMNS = ("scenario", "region", "budget", "area", "population", "cost")
+OUTPUT_COLUMNS = ("scenario", "region", "budget", "selected_indices", "selected_areas",
+                  "total_population", "total_cost")
+# Rows buffered before each Parquet row group is written
+PARQUET_ROW_GROUP = 1024
+
+
+def _number(value):
+    """Parses a CSV cell as an int when it is a whole number, otherwise as a float."""
+    if isinstance(value, (int, float)):
+        return value
+    number = float(value)
+    return int(number) if number.is_integer() else number
+
+
+def _is_parquet(path):
+    return os.path.splitext(path)[1].lower() in (".parquet", ".pq")
+
+
+def read_rows(path):
+    """Yields the input rows as dicts, reading Parquet files one record batch at a time."""
+    if _is_parquet(path):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(columns=list(INPUT_COLUMNS)):
+            yield from batch.to_pylist()
+    else:
+        with open(path, newline="") as f:
+            yield from csv.DictReader(f)
+
+
+def read_scenarios(path):
+    """Groups contiguous rows into scenarios and yields them one at a time."""
+    scenario = None
+    for row in read_rows(path):
+        if scenario is None or row["scenario"] != scenario["scenario"]:
+            if scenario is not None:
+                yield scenario
+            scenario = {"scenario": row["scenario"], "region": row["region"], "budget": _number(row["budget"]),
+                        "areas": [], "populations": [], "costs": []}
+        scenario["areas"].append(row["area"])
+        scenario["populations"].append(_number(row["population"]))
+        scenario["costs"].append(_number(row["cost"]))
+    if scenario is not None:
+        yield scenario
+
+
+def solve_scenario(scenario, engine=DEFAULT_ENGINE):
+    """Solves one scenario and returns its output row."""
+    selected = sorted(knapsack(scenario["populations"], scenario["costs"], scenario["budget"], engine))
+    return {
+        "scenario": scenario["scenario"],
+        "region": scenario["region"],
+        "budget": scenario["budget"],
+        "selected_indices": selected,
+        "selected_areas": [scenario["areas"][i] for i in selected],
+        "total_population": sum(scenario["populations"][i] for i in selected),
+        "total_cost": sum(scenario["costs"][i] for i in selected),
+    }
+
+
+class CsvResultWriter:
+    """Writes result rows to CSV as they arrive, joining the list columns with spaces and "|"."""
+
+    def __init__(self, path):
+        self._file = open(path, "w", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=OUTPUT_COLUMNS)
+        self._writer.writeheader()
+
+    def write(self, result):
+        row = dict(result)
+        row["selected_indices"] = " ".join(map(str, result["selected_indices"]))
+        row["selected_areas"] = "|".join(result["selected_areas"])
+        self._writer.writerow(row)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetResultWriter:
+    """Writes result rows to Parquet in row groups of PARQUET_ROW_GROUP, keeping the list columns as lists."""
+
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self._schema = pa.schema([
+            ("scenario", pa.string()), ("region", pa.string()), ("budget", pa.float64()),
+            ("selected_indices", pa.list_(pa.int64())), ("selected_areas", pa.list_(pa.string())),
+            ("total_population", pa.float64()), ("total_cost", pa.float64()),
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema)
+        self._rows = []
+
+    def write(self, result):
+        row = dict(result, scenario=str(result["scenario"]), region=str(result["region"]))
+        self._rows.append(row)
+        if len(self._rows) >= PARQUET_ROW_GROUP:
+            self._flush()
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+    def _flush(self):
+        if self._rows:
+            self._writer.write_table(self._pa.Table.from_pylist(self._rows, schema=self._schema))
+            self._rows = []
+
+
+def run_batch(input_path, output_path, workers=None, engine=DEFAULT_ENGINE):
+    """Solves every scenario in input_path on a process pool and writes the results to output_path.
+    At most a few scenarios per worker are in flight at once. Returns the number of scenarios solved."""
+    workers = workers or os.cpu_count() or 1
+    writer = ParquetResultWriter(output_path) if _is_parquet(output_path) else CsvResultWriter(output_path)
+    solved = 0
+    try:
+        with ProcessPoolExecutor(workers) as pool:
+            max_pending = 4 * workers
+            pending = deque()
+            for scenario in read_scenarios(input_path):
+                pending.append(pool.submit(solve_scenario, scenario, engine))
+                if len(pending) >= max_pending:
+                    writer.write(pending.popleft().result())
+                    solved += 1
+            while pending:
+                writer.write(pending.popleft().result())
+                solved += 1
+    finally:
+        writer.close()
+    return solved
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m clinic_alloc.batch", description=__doc__.split("\n")[0])
+    parser.add_argument("input", help="scenarios file (.csv or .parquet)")
+    parser.add_argument("-o", "--output", required=True, help="results file (.csv or .parquet)")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("-e", "--engine", default=DEFAULT_ENGINE, choices=sorted(ENGINES), help="solver engine")
+    args = parser.parse_args(argv)
+
+    solved = run_batch(args.input, args.output, args.workers, args.engine)
+    print(f"Solved {solved} scenarios -> {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+"""Benchmarks for the knapsack solver and the optimize_allocation pipeline.
+
+    python -m clinic_alloc.bench -o results.json [--n 10 100 1000] [--budget 100 10000] [--compare baseline.json]
+    python -m clinic_alloc.bench -o imports.json --imports
+
+Every case builds a seeded synthetic area table and times the stages of an optimize click: building the
+DataFrame (as an upload does), the typed AreaSet, solving, the selection mask and the pie figure. The solve,
+status and figure stages call the same functions as the app, and every run starts with no cached sweeps. For each stage it records the best wall time
+over --repeat runs, the process peak RSS after the stage, and the peak bytes allocated while it ran plus
+the blocks it left allocated (tracemalloc, in a separate untimed run). Each case runs in a fresh process so RSS figures
+do not leak between cases. With --compare, the run fails if any stage is more than --max-slowdown times
+slower than in the baseline file.
+With --imports, it instead times the start-up imports in fresh interpreters against IMPORT_BUDGETS and
+fails if one is over its budget or loads a module it should leave for later.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from clinic_alloc.areas import AreaSet
+from clinic_alloc.solver import DEFAULT_ENGINE, ENGINES, clear_sweeps, knapsack, solve_budget
+
+DISTRIBUTIONS = ("uniform", "round", "skewed")
+STAGES = ("dataframe", "areas", "solve", "status", "figure")
+SOLVER_STAGES = ("solve",)
+# Cases with more than this many areas x budget units are skipped
+MAX_CELLS = 1_000_000_000
+# Stages faster than this in both runs are too noisy to compare
+MIN_COMPARED_SECONDS = 0.001
+# Seconds a fresh interpreter may spend on each start-up statement, and the modules it must not import:
+# the solver core needs only NumPy, and the web app loads Plotly Express on its first chart
+IMPORT_BUDGETS = {
+    "import clinic_alloc": (0.5, ("pandas", "plotly", "dash")),
+    "import app; app.create_app()": (3.0, ("plotly.express",)),
+}
+# Directory holding app.py and the clinic_alloc package
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_areas(n, budget, distribution, seed=0):
+    """Seeded synthetic area table with costs scaled so that about half of the areas fit the budget.
+    "uniform" costs are uniform integers, "round" costs are rounded to two significant digits (as in
+    ministry sheets), and "skewed" costs are log-normal with the same mean."""
+    rng = np.random.default_rng(seed)
+    mean_cost = max(1, budget // n)
+    populations = rng.integers(1_000, 1_000_000, n)
+    if distribution == "skewed":
+        costs = np.maximum(1, rng.lognormal(0, 1, n) * mean_cost / np.exp(0.5)).astype(np.int64)
+    else:
+        costs = rng.integers(1, 2 * mean_cost + 1, n)
+        if distribution == "round":
+            unit = 10 ** max(0, len(str(2 * mean_cost)) - 2)
+            costs = np.maximum(1, np.round(costs / unit)).astype(np.int64) * unit
+    return [{"Area": f"Area {i}", "Population": int(p), "Cost": int(c)} for i, (p, c) in enumerate(zip(populations, costs))]
+
+
+def _stages(records, budget, engine, stages):
+    """The optimize_allocation pipeline split into named steps, each a function of the previous result."""
+    state = {}
+
+    def dataframe():
+        import pandas as pd
+
+        state["df"] = pd.DataFrame(records)
+
+    def areas():
+        state["areas"] = AreaSet.from_table(state["df"])
+
+    def solve():
+        if "areas" in state:
+            state["items"] = state["areas"].split()
+            populations, costs = state["items"][:2]
+        else:
+            populations, costs = [r["Population"] for r in records], [r["Cost"] for r in records]
+        # The default engine is what the app runs: a budget sweep when get_budget_sweep builds one
+        if engine == DEFAULT_ENGINE:
+            state["selected"] = solve_budget(populations, costs, budget)[0]
+        else:
+            state["selected"] = knapsack(populations, costs, budget, engine)
+
+    def status():
+        state["areas"].assign(state["selected"], state["items"][0], *state["items"][2:])
+
+    def figure():
+        state["areas"].pie_figure()
+
+    steps = {"dataframe": dataframe, "areas": areas, "solve": solve, "status": status, "figure": figure}
+    return [(name, steps[name]) for name in stages]
+
+
+def run_case(n, budget, distribution, engine=DEFAULT_ENGINE, repeat=3, seed=0, stages=STAGES):
+    """Benchmarks one case and returns its result dict."""
+    records = make_areas(n, budget, distribution, seed)
+    timings = {name: [] for name in stages}
+    rss = {}
+    for _ in range(repeat):
+        # A cached sweep would answer the repeated solve without any DP work
+        clear_sweeps()
+        for name, step in _stages(records, budget, engine, stages):
+            start = time.perf_counter()
+            step()
+            timings[name].append(time.perf_counter() - start)
+            rss[name] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    allocations = {}
+    clear_sweeps()
+    for name, step in _stages(records, budget, engine, stages):
+        tracemalloc.start()
+        step()
+        _, peak = tracemalloc.get_traced_memory()
+        blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+        tracemalloc.stop()
+        allocations[name] = (peak, blocks)
+
+    return {
+        "n": n, "budget": budget, "distribution": distribution, "engine": engine, "seed": seed,
+        "stages": {name: {"seconds": min(timings[name]), "peak_rss_kb": rss[name],
+                          "alloc_peak_bytes": allocations[name][0], "alloc_blocks": allocations[name][1]}
+                   for name in stages},
+    }
+
+
+def time_import(statement, forbidden=(), repeat=3):
+    """Best wall time of statement over repeat fresh interpreters, and which of the forbidden modules
+    (or their submodules) it loaded."""
+    code = ("import sys, time, json; start = time.perf_counter(); "
+            f"exec({statement!r}); seconds = time.perf_counter() - start; "
+            "print(json.dumps([seconds, sorted(sys.modules)]))")
+    runs = [json.loads(subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True,
+                                      check=True).stdout) for _ in range(repeat)]
+    loaded = [name for name in forbidden if any(m == name or m.startswith(name + ".") for m in runs[0][1])]
+    return {"seconds": min(seconds for seconds, _ in runs), "loaded": loaded}
+
+
+def check_imports(imports, budgets=IMPORT_BUDGETS):
+    """Returns a message for every statement over its time budget or loading a module it must not."""
+    failures = []
+    for statement, (budget, _) in budgets.items():
+        result = imports[statement]
+        if result["seconds"] > budget:
+            failures.append(f"{statement}: {result['seconds']:.3f}s, budget {budget}s")
+        if result["loaded"]:
+            failures.append(f"{statement}: imports {', '.join(result['loaded'])}")
+    return failures
+
+
+def case_key(result):
+    return result["n"], result["budget"], result["distribution"], result["engine"]
+
+
+def compare(results, baseline, max_slowdown):
+    """Returns a message for every stage more than max_slowdown times slower than in the baseline."""
+    previous = {case_key(r): r for r in baseline["results"]}
+    failures = []
+    for result in results:
+        old = previous.get(case_key(result))
+        if old is None:
+            continue
+        for name, stage in result["stages"].items():
+            before = old["stages"].get(name, {}).get("seconds")
+            if before is None or max(before, stage["seconds"]) < MIN_COMPARED_SECONDS:
+                continue
+            if stage["seconds"] > before * max_slowdown:
+                failures.append(f"n={result['n']} budget={result['budget']} {result['distribution']} {name}: "
+                                f"{stage['seconds']:.4f}s vs {before:.4f}s")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m clinic_alloc.bench", description=__doc__.split("\n")[0])
+    parser.add_argument("-o", "--output", required=True, help="JSON file to write the results to")
+    parser.add_argument("--n", type=int, nargs="+", default=[10, 100, 1000, 10000], help="numbers of areas")
+    parser.add_argument("--budget", type=int, nargs="+", default=[10 ** 2, 10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6])
+    parser.add_argument("--distribution", nargs="+", default=list(DISTRIBUTIONS), choices=DISTRIBUTIONS)
+    parser.add_argument("-e", "--engine", default=DEFAULT_ENGINE, choices=sorted(ENGINES))
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage; the fastest is kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-cells", type=int, default=MAX_CELLS, help="skip cases with more areas x budget")
+    parser.add_argument("--solver-only", action="store_true", help="time only the solve stage (no pandas/Plotly)")
+    parser.add_argument("--imports", action="store_true", help="check the start-up imports against IMPORT_BUDGETS")
+    parser.add_argument("--compare", help="baseline JSON file from an earlier run")
+    parser.add_argument("--max-slowdown", type=float, default=1.25, help="allowed time ratio against the baseline")
+    args = parser.parse_args(argv)
+
+    meta = {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    if args.imports:
+        imports = {statement: time_import(statement, forbidden, args.repeat)
+                   for statement, (_, forbidden) in IMPORT_BUDGETS.items()}
+        for statement, result in imports.items():
+            print(f"{statement:32} {result['seconds']:.3f}s", file=sys.stderr)
+        with open(args.output, "w") as f:
+            json.dump({"meta": meta, "imports": imports}, f, indent=2)
+        failures = check_imports(imports)
+        for failure in failures:
+            print(f"OVER BUDGET: {failure}", file=sys.stderr)
+        return 1 if failures else 0
+
+    stages = SOLVER_STAGES if args.solver_only else STAGES
+    results = []
+    # A fresh process per case keeps peak RSS from one case out of the next
+    context = multiprocessing.get_context("spawn")
+    for distribution in args.distribution:
+        for n in args.n:
+            for budget in args.budget:
+                if n * budget > args.max_cells:
+                    continue
+                with ProcessPoolExecutor(1, mp_context=context) as pool:
+                    result = pool.submit(run_case, n, budget, distribution, args.engine, args.repeat,
+                                         args.seed, stages).result()
+                results.append(result)
+                print(f"{distribution:8} n={n:<6} budget={budget:<8} " +
+                      " ".join(f"{name}={stage['seconds']:.4f}s" for name, stage in result["stages"].items()),
+                      file=sys.stderr)
+
+    report = {"meta": meta, "results": results}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            failures = compare(results, json.load(f), args.max_slowdown)
+        for failure in failures:
+            print(f"SLOWER: {failure}", file=sys.stderr)
+        return 1 if failures else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""Server-side area tables: one columnar DataFrame per browser session, paged, sorted and filtered in place.
+
+Callbacks pass the session id and small diffs (edited rows, new areas, uploads) instead of the whole
+table, and the DataTables use page_action="custom" so the browser only ever receives the rows on screen.
+"""
+import base64
+from collections import OrderedDict
+import io
+import math
+import re
+import threading
+
+import pandas as pd
+
+# Column holding each row's stable id; DataTable uses it to tell edited rows apart on any page
+ROW_ID = "id"
+REQUIRED_COLUMNS = ("Area", "Population", "Cost")
+
+# One "{column} operator value" term of a DataTable filter_query; terms are joined with "&&"
+_FILTER_TERM = re.compile(r"^\{(?P<column>[^}]+)\}\s*(?P<op>[si]?(?:contains|datestartswith|eq|ne|le|lt|ge|gt|<=|>=|!=|=|<|>))"
+                          r"\s*(?P<value>.*)$")
+_COMPARISONS = {"=": "eq", "!=": "ne", "<": "lt", "<=": "le", ">": "gt", ">=": "ge"}
+
+
+class DatasetStore:
+    """Area table and last optimization result of every session, evicting the least recently used
+    session beyond max_sessions. A session's table starts as a copy of default, a table or a function
+    building it when the first session starts. Tables are never changed in place (each edit swaps in a new
+    frame), so a frame handed out stays valid while a job solves it."""
+
+    def __init__(self, default, max_sessions=64):
+        self._default = default if callable(default) else with_row_ids(default)
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # session id -> {"table", "results", "version"}
+        self._lock = threading.Lock()
+
+    def _session(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            if callable(self._default):
+                self._default = with_row_ids(self._default())
+            session = self._sessions[session_id] = {"table": self._default, "results": None, "version": 0}
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def table(self, session_id):
+        with self._lock:
+            return self._session(session_id)["table"]
+
+    def results(self, session_id):
+        """The last result table published for the session, or None."""
+        with self._lock:
+            return self._session(session_id)["results"]
+
+    def _swap(self, session_id, key, frame):
+        with self._lock:
+            session = self._session(session_id)
+            session[key] = frame
+            session["version"] += 1
+            return session["version"]
+
+    def replace(self, session_id, table):
+        """Replaces the session's table (e.g. with an uploaded one) and returns the new version."""
+        return self._swap(session_id, "table", with_row_ids(table))
+
+    def append(self, session_id, record):
+        """Adds one area with the next row id and returns the new version."""
+        table = self.table(session_id)
+        row_id = int(table[ROW_ID].max()) + 1 if len(table) else 0
+        return self._swap(session_id, "table", pd.concat([table, pd.DataFrame([{**record, ROW_ID: row_id}])],
+                                                         ignore_index=True))
+
+    def update_rows(self, session_id, records):
+        """Overwrites the rows whose ids appear in records (edited DataTable rows) and returns the new version."""
+        current = self.table(session_id).set_index(ROW_ID)
+        updated = pd.DataFrame(records).set_index(ROW_ID).reindex(columns=current.columns)
+        updated = updated[updated.index.isin(current.index)]
+        table = pd.concat([current.drop(index=updated.index), updated]).reindex(current.index).reset_index()
+        return self._swap(session_id, "table", table)
+
+    def publish(self, session_id, results):
+        """Keeps an optimization's result table (or None) for paging and returns the new version."""
+        return self._swap(session_id, "results", results)
+
+    def stats(self):
+        with self._lock:
+            return {"sessions": len(self._sessions),
+                    "rows": sum(len(s["table"]) for s in self._sessions.values())}
+
+
+def with_row_ids(table):
+    """Copy of table with a ROW_ID column, numbering the rows from 0 when it has none."""
+    table = table.reset_index(drop=True)
+    if ROW_ID not in table:
+        table.insert(0, ROW_ID, range(len(table)))
+    return table
+
+
+def read_upload(contents, filename=None):
+    """Parses dcc.Upload contents (a base64 data URL) of a CSV file into an area table.
+    Raises ValueError when it cannot be parsed or lacks the Area, Population and Cost columns."""
+    _, _, payload = (contents or "").partition(",")
+    try:
+        table = pd.read_csv(io.BytesIO(base64.b64decode(payload)))
+    except (ValueError, pd.errors.ParserError) as e:
+        raise ValueError(f"could not read {filename or 'the file'} as CSV: {e}") from e
+    missing = [column for column in REQUIRED_COLUMNS if column not in table]
+    if missing:
+        raise ValueError(f"{filename or 'the file'} has no {', '.join(missing)} column")
+    return table.drop(columns=[ROW_ID], errors="ignore")
+
+
+def _parse_value(text):
+    text = text.strip()
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in "\"'`":
+        return text[1:-1]
+    try:
+        number = float(text)
+    except ValueError:
+        return text
+    return int(number) if number.is_integer() else number
+
+
+def filter_table(table, filter_query):
+    """Rows of table matching a DataTable filter_query ("{Cost} > 100 && {Area} contains Cairo").
+    Terms on unknown columns or with operators it does not know are ignored."""
+    for term in (filter_query or "").split(" && "):
+        match = _FILTER_TERM.match(term.strip())
+        if match is None or match["column"] not in table:
+            continue
+        column, value = table[match["column"]], _parse_value(match["value"])
+        # An "s" or "i" prefix makes the operator case sensitive or insensitive
+        insensitive = match["op"].startswith("i")
+        op = match["op"].lstrip("si")
+        op = _COMPARISONS.get(op, op)
+        if op in ("contains", "datestartswith"):
+            text = column.astype(str)
+            needle = str(value)
+            if insensitive:
+                text, needle = text.str.lower(), needle.lower()
+            mask = text.str.contains(needle, regex=False) if op == "contains" else text.str.startswith(needle)
+        else:
+            if insensitive and isinstance(value, str):
+                column, value = column.astype(str).str.lower(), value.lower()
+            try:
+                mask = getattr(column, op)(value)
+            except TypeError:
+                # Comparing text with a number (or the reverse) matches nothing, as in the browser
+                mask = pd.Series(False, index=table.index)
+        table = table[mask.fillna(False)]
+    return table
+
+
+def sort_table(table, sort_by):
+    """table sorted by a DataTable sort_by list ([{"column_id": ..., "direction": "asc"|"desc"}, ...])."""
+    sort_by = [s for s in sort_by or [] if s["column_id"] in table]
+    if not sort_by:
+        return table
+    return table.sort_values([s["column_id"] for s in sort_by], ascending=[s["direction"] == "asc" for s in sort_by],
+                             kind="stable", na_position="last")
+
+
+def page(table, page_current, page_size, sort_by=None, filter_query=None):
+    """Returns (records, page_count) for one page of the filtered and sorted table."""
+    if table is None:
+        return [], 1
+    table = sort_table(filter_table(table, filter_query), sort_by)
+    page_current, page_size = page_current or 0, page_size or len(table) or 1
+    rows = table.iloc[page_current * page_size:(page_current + 1) * page_size]
+    return rows.to_dict("records"), max(1, math.ceil(len(table) / page_size))
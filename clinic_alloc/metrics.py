@@ -0,0 +1,168 @@
+"""Minimal in-process metrics with Prometheus text exposition, plus opt-in profiling of slow requests.
+
+Counters, gauges and histograms register themselves in REGISTRY; REGISTRY.render() produces the text
+served on /metrics. Only the standard library is used.
+"""
+from contextlib import contextmanager
+import cProfile
+import math
+import os
+import threading
+import time
+
+# Default latency buckets in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Buckets for sizes that span many orders of magnitude (areas, budgets, DP cells)
+SIZE_BUCKETS = tuple(10 ** k for k in range(1, 11))
+
+
+class Registry:
+    """Collection of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics)
+        return "".join(metric.render() for metric in metrics)
+
+
+REGISTRY = Registry()
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple((name, str(labels[name])) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}\n", f"# TYPE {self.name} {self.kind}\n"]
+        lines.extend(self._samples())
+        return "".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        super().__init__(name, help, labelnames, registry)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            return [f"{self.name}{_format_labels(key)} {_format_value(value)}\n" for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down. With a function, the value is read from it at render time."""
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY, function=None):
+        super().__init__(name, help, labelnames, registry)
+        self._values = {}
+        self._function = function
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self):
+        if self._function is not None:
+            return [f"{self.name} {_format_value(self._function())}\n"]
+        with self._lock:
+            return [f"{self.name}{_format_labels(key)} {_format_value(value)}\n" for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram of observed values."""
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames, registry)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values = {}  # label key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.setdefault(key, [0] * len(self.buckets) + [0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the wall time of the with-block in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        lines = []
+        with self._lock:
+            for key, state in self._values.items():
+                for bound, count in zip(self.buckets, state):
+                    lines.append(f"{self.name}_bucket{_format_labels(key + (('le', _format_value(bound)),))} {count}\n")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(state[-2])}\n")
+                lines.append(f"{self.name}_count{_format_labels(key)} {state[-1]}\n")
+        return lines
+
+
+@contextmanager
+def profile_if_slow(directory, threshold, name):
+    """Profiles the with-block with cProfile when directory is set, keeping the stats file
+    (directory/name-<timestamp>.prof) only if the block took longer than threshold seconds."""
+    if not directory:
+        yield
+        return
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        if time.perf_counter() - start > threshold:
+            os.makedirs(directory, exist_ok=True)
+            profiler.dump_stats(os.path.join(directory, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{threading.get_ident()}.prof"))
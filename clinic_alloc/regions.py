@@ -0,0 +1,165 @@
+"""Region-partitioned solve: one DP curve per region on a process pool, merged to split the national budget.
+
+A region's best population for every budget up to its cap does not depend on the other regions, so the
+curves are computed in parallel. merge_curves then splits the national budget between the regions by a
+group knapsack (max-plus convolution of the curves), and a second parallel pass traces each region's
+selection at its share.
+
+Merging is quadratic in the budget (max-plus convolution has no general shortcut), so national budgets of
+more than MERGE_GRID units are split in steps of budget / MERGE_GRID. The curves themselves stay exact; only
+each region's share is rounded down to a step, and the plan reports how far that can be from optimal.
+"""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import math
+import multiprocessing
+import threading
+
+import numpy as np
+
+from clinic_alloc.solver import BudgetSweep, best_values, knapsack, merge_curves
+
+# Problems with fewer areas x budget cells than this are solved in-process; starting workers costs more
+PARALLEL_MIN_CELLS = 2_000_000
+# Largest number of budget steps the national budget is split into when merging the region curves
+MERGE_GRID = 2048
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """The process pool shared by all region solves, started on first use with one worker per CPU.
+    Workers are spawned rather than forked, since the pool is first used from a threaded server."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+
+def _discard_executor(executor):
+    """Forgets a broken pool so that the next get_executor() starts a fresh one."""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+class RegionPlan:
+    """Result of solve_regions.
+    selected holds the chosen item indices, row[b] the best national population within budget b * unit,
+    and regions one dict per region (in order of first appearance) with its name, cap, allocated budget,
+    selected item indices, population and cost. gap bounds how far the total is below the optimum when the
+    budget was split in steps (0 when it was split exactly)."""
+
+    # row and unit have the same meaning as in BudgetSweep, so the national curve is drawn the same way
+    curve = BudgetSweep.curve
+
+    def __init__(self, selected, row, unit, regions, gap=0):
+        self.selected = selected
+        self.row = row
+        self.unit = unit
+        self.regions = regions
+        self.gap = gap
+
+
+def _run(tasks, parallel, progress, sizes):
+    """Runs (function, *args) tasks on the shared process pool when parallel is true, in-process otherwise,
+    and returns their results in order. progress(done, total) counts the items (sizes[i] per task) of the
+    finished tasks. When a worker dies (killed for memory, say) the pool is broken for good, so it is
+    replaced and the tasks run once more on the fresh one."""
+    if not parallel:
+        return _run_tasks(tasks, None, progress, sizes)
+    executor = get_executor()
+    try:
+        return _run_tasks(tasks, executor, progress, sizes)
+    except BrokenProcessPool:
+        _discard_executor(executor)
+    executor = get_executor()
+    try:
+        return _run_tasks(tasks, executor, progress, sizes)
+    except BrokenProcessPool:
+        _discard_executor(executor)
+        raise
+
+
+def _run_tasks(tasks, executor, progress, sizes):
+    """_run on one executor, or in-process when executor is None."""
+    total, done = sum(sizes), 0
+    if executor is None:
+        results = []
+        for (function, *args), size in zip(tasks, sizes):
+            results.append(function(*args))
+            done += size
+            if progress is not None:
+                progress(done, total)
+        return results
+
+    futures = {executor.submit(*task): i for i, task in enumerate(tasks)}
+    results = [None] * len(tasks)
+    pending = set(futures)
+    try:
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                results[futures[future]] = future.result()
+                done += sizes[futures[future]]
+            if progress is not None:
+                progress(done, total)
+    except BaseException:
+        # Cancelled from progress or a worker failed: drop the regions that have not started
+        for future in pending:
+            future.cancel()
+        raise
+    return results
+
+
+def solve_regions(values, weights, regions, budget, caps=None, parallel=None, progress=None):
+    """Selects items within budget where item i belongs to group regions[i], optionally with a budget
+    cap per region (caps maps region -> cap). Costs must be whole numbers.
+    The region curves and selections run on the shared process pool when parallel is True, or when it
+    is None and the problem has at least PARALLEL_MIN_CELLS cells. Returns a RegionPlan."""
+    if not all(float(w).is_integer() for w in weights):
+        raise ValueError("splitting the budget by region needs whole-number costs")
+    caps = caps or {}
+    unit = math.gcd(*(int(w) for w in weights)) or 1
+    reduced = [int(w) // unit for w in weights]
+    capacity = int(budget) // unit
+
+    members = {}
+    for i, region in enumerate(regions):
+        members.setdefault(region, []).append(i)
+    names = list(members)
+    limits = [min(capacity, int(caps[name]) // unit) if caps.get(name) is not None else capacity for name in names]
+    groups = [([values[i] for i in members[name]], [reduced[i] for i in members[name]]) for name in names]
+    sizes = [len(members[name]) for name in names]
+
+    if parallel is None:
+        parallel = len(values) * capacity >= PARALLEL_MIN_CELLS
+    parallel = parallel and len(names) > 1
+
+    curves = _run([(best_values, v, w, limit) for (v, w), limit in zip(groups, limits)], parallel, progress, sizes)
+    step = max(1, -(-capacity // MERGE_GRID))
+    gap = 0
+    if step == 1:
+        row, budgets = merge_curves(curves, capacity)
+    else:
+        # A share of k steps is worth curve[k * step], and any share b is worth at most
+        # curve[(b // step + 1) * step - 1], so merging those upper curves bounds the unrounded optimum
+        grid = capacity // step
+        row, budgets = merge_curves([curve[::step] for curve in curves], grid)
+        ends = np.arange(1, grid + 2) * step - 1
+        upper, _ = merge_curves([curve[np.minimum(ends, len(curve) - 1)] for curve in curves], grid)
+        gap = (upper[-1] - row[-1]).item()
+        budgets = [b * step for b in budgets]
+    selections = _run([(knapsack, v, w, b) for (v, w), b in zip(groups, budgets)], parallel, None, sizes)
+
+    plan = []
+    for name, b, selection in zip(names, budgets, selections):
+        chosen = sorted(members[name][j] for j in selection)
+        plan.append({"region": name, "cap": caps.get(name), "budget": b * unit, "selected": chosen,
+                     "population": sum(values[i] for i in chosen), "cost": sum(weights[i] for i in chosen)})
+    selected = sorted((i for region in plan for i in region["selected"]), reverse=True)
+    return RegionPlan(selected, row, unit * step, plan, gap)
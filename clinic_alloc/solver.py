@@ -0,0 +1,887 @@
+"""Knapsack solver engines for clinic allocation.
+
+Only NumPy is needed here, so the solvers can be used without the Dash app (see clinic_alloc.batch).
+"""
+from collections import OrderedDict
+import copy
+import math
+import threading
+import time
+
+import numpy as np
+
+
+def value_dtype(values):
+    """dtype of the DP value rows for these populations: int64 when they are all integers, float64
+    otherwise, so that a fractional population is summed exactly rather than truncated."""
+    return np.result_type(np.asarray(values), np.int64)
+
+
+def knapsack_loop(values, weights, capacity, progress=None):
+    """Solves the 0/1 Knapsack problem using Dynamic Programming.
+    Time Complexity: O(n * capacity), where n is the number of items and capacity is the maximum weight of the knapsack."""
+    n = len(values)  
+    # Create a 2D DP table where dp[i][w] represents the maximum value attainable 
+    # with the first i items and a weight limit of w
+    dp = np.zeros((n + 1, capacity + 1), dtype=value_dtype(values))
+
+    # Fill the DP table
+    for i in range(1, n + 1):  
+        for w in range(capacity + 1):  # w = 0 matters too: zero-cost items fit there
+            if weights[i - 1] <= w:  # If the current item's weight is less than or equal to the capacity
+                # Either exclude the item or include it (add its value and subtract its weight)
+                dp[i][w] = max(dp[i - 1][w], dp[i - 1][w - weights[i - 1]] + values[i - 1])
+            else:
+                # If the item's weight is greater than the current capacity, exclude it
+                dp[i][w] = dp[i - 1][w]
+        if progress is not None:
+            progress(i, n)
+
+    return _trace_back(dp, weights, capacity)
+
+
+def knapsack_numpy(values, weights, capacity, progress=None):
+    """Solves the 0/1 Knapsack problem using Dynamic Programming, one item row at a time.
+    Each row is a single shifted np.maximum over the previous row instead of a Python loop over every weight.
+    Time Complexity: O(n * capacity), with the inner loop running in NumPy."""
+    n = len(values)
+    dp = np.zeros((n + 1, capacity + 1), dtype=value_dtype(values))
+
+    for i in range(1, n + 1):
+        weight, value = int(weights[i - 1]), values[i - 1]
+        dp[i] = dp[i - 1]
+        if 0 < weight <= capacity:
+            # Capacities w >= weight may take the item: compare against the previous row shifted by its weight
+            np.maximum(dp[i - 1, weight:], dp[i - 1, :capacity + 1 - weight] + value, out=dp[i, weight:])
+        elif weight == 0:
+            # A free item is worth taking at every capacity, the w = 0 column included
+            dp[i] += max(value, 0)
+        if progress is not None:
+            progress(i, n)
+
+    return _trace_back(dp, weights, capacity)
+
+
+def knapsack_bitset(values, weights, capacity, progress=None):
+    """Solves the 0/1 Knapsack problem keeping a single value row and a packed 1-bit "took item" table.
+    Memory: O(capacity) for the value row plus n * (capacity + 1) / 8 bytes for the bits,
+    instead of the 8 * n * capacity bytes of the full int64 table.
+    Time Complexity: O(n * capacity)."""
+    _, keep = _fill_bitset(values, weights, capacity, progress)
+    return _trace_bits(keep, weights, capacity)
+
+
+def _fill_bitset(values, weights, capacity, progress=None):
+    """Runs the DP over a single value row and returns (row, keep), where row[w] is the best value
+    within capacity w and keep[i] holds one packed bit per capacity, set when item i improves it."""
+    row = np.zeros(capacity + 1, dtype=value_dtype(values))
+    keep = np.zeros((len(values), (capacity + 8) // 8), dtype=np.uint8)
+
+    for i in range(len(values)):
+        keep[i] = _add_item(row, int(weights[i]), values[i])
+        if progress is not None:
+            progress(i + 1, len(values))
+
+    return row, keep
+
+
+def _add_item(row, weight, value):
+    """Updates the value row in place with one more item and returns its packed "took item" bits."""
+    capacity = len(row) - 1
+    if weight > capacity or weight < 0:
+        return np.zeros((capacity + 8) // 8, dtype=np.uint8)
+    candidate = row[:capacity + 1 - weight] + value
+    took = candidate > row[weight:]
+    np.maximum(row[weight:], candidate, out=row[weight:])
+    return np.packbits(np.concatenate((np.zeros(weight, dtype=bool), took)))
+
+
+def _trace_bits(keep, weights, capacity):
+    """Recovers the selected item indices at the given capacity from packed "took item" bits."""
+    # Trace back using the bits instead of comparing adjacent DP rows
+    w = capacity
+    selected = []
+    for i in range(len(keep) - 1, -1, -1):
+        if keep[i][w >> 3] >> (7 - (w & 7)) & 1:
+            selected.append(i)
+            w -= weights[i]
+
+    return selected
+
+
+class _FrontierTooLarge(Exception):
+    """Raised by knapsack_pareto when the frontier outgrows its state limit."""
+
+
+def knapsack_pareto(values, weights, capacity, progress=None, max_states=None):
+    """Solves the 0/1 Knapsack problem over the sparse Pareto frontier of (cost, value) pairs.
+    After each item only the non-dominated pairs are kept (no cheaper pair has an equal or higher value),
+    so work depends on the frontier size rather than on the capacity.
+    Time Complexity: O(n * F log F), where F is the largest frontier size (at most capacity + 1)."""
+    costs = np.zeros(1, dtype=np.int64)
+    gains = np.zeros(1, dtype=value_dtype(values))
+    # For every item, the frontier position each new pair came from and whether the item was taken
+    parents, took = [], []
+
+    for weight, value in zip(weights, values):
+        weight = int(weight)
+        positions = np.arange(len(costs))
+        fits = (costs + weight <= capacity) & (weight >= 0)
+        all_costs = np.concatenate((costs, costs[fits] + weight))
+        all_gains = np.concatenate((gains, gains[fits] + value))
+        all_parents = np.concatenate((positions, positions[fits]))
+        all_took = np.concatenate((np.zeros(len(costs), dtype=bool), np.ones(int(fits.sum()), dtype=bool)))
+
+        # Sort by cost, then highest value first, preferring to skip the item on a tie
+        order = np.lexsort((all_took, -all_gains, all_costs))
+        all_gains = all_gains[order]
+        # Keep a pair only if it is strictly better than every cheaper pair
+        best_before = np.maximum.accumulate(all_gains)
+        keep = np.ones(len(order), dtype=bool)
+        keep[1:] = all_gains[1:] > best_before[:-1]
+
+        order = order[keep]
+        costs, gains = all_costs[order], all_gains[keep]
+        parents.append(all_parents[order])
+        took.append(all_took[order])
+        if max_states is not None and len(costs) > max_states:
+            raise _FrontierTooLarge(len(costs))
+        if progress is not None:
+            progress(len(parents), len(values))
+
+    # The last pair has the highest value within the capacity; follow its parents back
+    state = len(costs) - 1
+    selected = []
+    for i in range(len(parents) - 1, -1, -1):
+        if took[i][state]:
+            selected.append(i)
+        state = parents[i][state]
+
+    return selected
+
+
+# Above this many bytes the full DP table is not allocated and the bitset engine is used instead
+DENSE_TABLE_LIMIT = 256 * 1024 * 1024
+# A frontier pair costs roughly this many dense DP cells of work (concatenate, sort, filter)
+PARETO_STATE_COST = 16
+
+
+def choose_engine(values, weights, capacity):
+    """Picks a dense engine for the (GCD-reduced) problem: "numpy" when the full table fits in
+    DENSE_TABLE_LIMIT, otherwise the low-memory "bitset" engine."""
+    if (len(values) + 1) * (capacity + 1) * 8 <= DENSE_TABLE_LIMIT:
+        return "numpy"
+    return "bitset"
+
+
+def knapsack_auto(values, weights, capacity, progress=None):
+    """Solves the 0/1 Knapsack problem with whichever engine suits the problem's shape.
+    The sparse Pareto engine is tried first when there are few items or the frontier stays much
+    narrower than the capacity; once the frontier grows past capacity / PARETO_STATE_COST pairs the
+    dense DP is cheaper, so the solve falls back to it."""
+    n = len(values)
+    max_states = (capacity + 1) // PARETO_STATE_COST
+    if n < 63 and 2 ** n <= max_states:
+        # The frontier can never hold more than 2 ** n pairs
+        return knapsack_pareto(values, weights, capacity, progress)
+    if max_states > n:
+        try:
+            return knapsack_pareto(values, weights, capacity, progress, max_states=max_states)
+        except _FrontierTooLarge:
+            pass
+    return ENGINES[choose_engine(values, weights, capacity)](values, weights, capacity, progress)
+
+
+def knapsack_branch_and_bound(values, weights, capacity, node_limit=None, time_limit=None):
+    """Solves the 0/1 Knapsack problem by depth-first branch and bound, pruning with the fractional (Dantzig) bound.
+    Costs and capacity may be real numbers, since nothing is indexed by cost.
+    When node_limit nodes have been explored or time_limit seconds have passed, the search stops early.
+    Returns (selected_indices, gap), where gap is how far the returned solution may be below the optimum (0 when proven optimal).
+    Time Complexity: O(2^n) in the worst case, usually far less thanks to the bound."""
+    # Items that can never fit are dropped; the rest are ordered by population per unit of cost
+    items = [i for i in range(len(values)) if 0 <= weights[i] <= capacity]
+    items.sort(key=lambda i: values[i] / weights[i] if weights[i] > 0 else math.inf, reverse=True)
+    item_values = [values[i] for i in items]
+    item_weights = [weights[i] for i in items]
+    integral_values = all(float(v).is_integer() for v in item_values)
+    n = len(items)
+
+    # Prefix sums let the bound find the first item that no longer fits with one bisection
+    prefix_weights = np.concatenate(([0], np.cumsum(item_weights, dtype=float)))
+    prefix_values = np.concatenate(([0], np.cumsum(item_values, dtype=float)))
+
+    def bound(k, remaining, value):
+        # Take items k, k+1, ... greedily, then the fitting fraction of the first one that does not fit
+        j = int(np.searchsorted(prefix_weights, prefix_weights[k] + remaining, side="right")) - 1
+        total = value + prefix_values[j] - prefix_values[k]
+        if j < n:
+            total += (remaining - (prefix_weights[j] - prefix_weights[k])) * item_values[j] / item_weights[j]
+        # With whole populations no solution can beat the floor of the bound
+        return math.floor(total + 1e-9) if integral_values else total
+
+    best_value, best_taken = 0, None
+    # Each node is (next item, remaining capacity, value so far, taken items as a linked tuple)
+    stack = [(0, capacity, 0, None)]
+    nodes = 0
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+    while stack:
+        if (node_limit is not None and nodes >= node_limit) or \
+                (deadline is not None and nodes % 1024 == 0 and time.monotonic() >= deadline):
+            break
+        k, remaining, value, taken = stack.pop()
+        nodes += 1
+        if value > best_value:
+            best_value, best_taken = value, taken
+        if k == n or bound(k, remaining, value) <= best_value:
+            continue
+        # Push the exclude branch first so the include branch is explored first
+        stack.append((k + 1, remaining, value, taken))
+        if item_weights[k] <= remaining:
+            stack.append((k + 1, remaining - item_weights[k], value + item_values[k], (k, taken)))
+
+    # Open nodes bound the optimum when the search was cut short
+    upper = max([best_value] + [bound(k, remaining, value) for k, remaining, value, _ in stack])
+    selected = []
+    while best_taken is not None:
+        k, best_taken = best_taken
+        selected.append(items[k])
+
+    return sorted(selected, reverse=True), upper - best_value
+
+
+def _fptas_plan(values, weights, capacity, epsilon):
+    """The greedy bounds and the scaled large areas of knapsack_fptas for float64 values and weights, or None
+    when no area fits. Returns (upper bound, scale, large areas, their scaled populations, small areas in
+    greedy order, top scaled total)."""
+    fits = np.flatnonzero((weights >= 0) & (weights <= capacity) & (values > 0))
+    if not len(fits):
+        return None
+
+    # Greedy by population per unit of cost (free areas first): its fitting prefix and the best single area
+    # bound the optimum from below, and adding the fitting fraction of the next area bounds it from above
+    with np.errstate(divide="ignore"):
+        ratio = np.where(weights[fits] > 0, values[fits] / weights[fits], np.inf)
+    order = fits[np.argsort(-ratio, kind="stable")]
+    prefix_weights = np.cumsum(weights[order])
+    prefix_values = np.cumsum(values[order])
+    k = int(np.searchsorted(prefix_weights, capacity, side="right"))
+    greedy = prefix_values[k - 1] if k else 0.0
+    upper = greedy
+    if k < len(order):
+        upper += (capacity - (prefix_weights[k - 1] if k else 0.0)) * values[order[k]] / weights[order[k]]
+    lower = max(greedy, values[fits].max())
+
+    half = epsilon / 2
+    scale = half * half * lower / 2
+    is_large = values[order] > half * lower
+    large, small = order[is_large], order[~is_large]
+    top = int(upper / scale) + 1  # No feasible set of large areas scales to more than this
+    scaled = np.floor(values[large] / scale).astype(np.int64)
+    # Within one scaled value, at most top // value areas can ever be chosen together: keep the cheapest ones
+    by_value = np.lexsort((weights[large], scaled))
+    large, scaled = large[by_value], scaled[by_value]
+    starts = np.searchsorted(scaled, scaled, side="left")
+    kept = np.arange(len(scaled)) - starts < top // np.maximum(scaled, 1)
+    return upper, scale, large[kept], scaled[kept], small, top
+
+
+def knapsack_fptas(values, weights, capacity, epsilon, progress=None):
+    """Approximates the 0/1 Knapsack problem within a factor (1 - epsilon) of the optimum (an FPTAS).
+    A greedy pass by population per unit cost gives a lower bound L >= OPT / 2. Areas worth more than
+    epsilon / 2 * L ("large") are solved by a DP indexed by their population scaled down by
+    K = (epsilon / 2)^2 * L / 2, holding the least cost of every scaled total; each DP state is then
+    topped up greedily with the remaining ("small") areas, and the best state is kept. Scaling loses at
+    most epsilon / 2 * OPT and the greedy top-up less than one small area, so the total is >= (1 - epsilon) * OPT.
+    Costs may be real numbers. Returns (selected_indices, gap), where gap bounds the distance to the
+    optimum by the tighter of the fractional (Dantzig) bound and the (1 - epsilon) guarantee.
+    Time Complexity: O(n log n + large areas * 16 / epsilon^2), independent of the budget."""
+    if not 0 < epsilon < 1:
+        raise ValueError(f"epsilon must be between 0 and 1, got {epsilon}")
+    values, weights = np.asarray(values), np.asarray(weights)
+    integral_values = values.dtype.kind in "iub" or bool(np.all(values == np.floor(values)))
+    values, weights = values.astype(np.float64), weights.astype(np.float64)
+    plan = _fptas_plan(values, weights, capacity, epsilon)
+    if plan is None:
+        return [], 0
+    upper, scale, large, scaled, small, top = plan
+
+    # least_cost[j] is the least cost of large areas whose scaled populations sum to exactly j
+    least_cost = np.full(top + 1, np.inf)
+    least_cost[0] = 0
+    keep = np.zeros((len(large), (top + 8) // 8), dtype=np.uint8)
+    for i, (value, weight) in enumerate(zip(scaled, weights[large])):
+        candidate = least_cost[:top + 1 - value] + weight
+        took = candidate < least_cost[value:]
+        np.minimum(least_cost[value:], candidate, out=least_cost[value:])
+        keep[i] = np.packbits(np.concatenate((np.zeros(value, dtype=bool), took)))
+        if progress is not None:
+            progress(i + 1, len(large))
+
+    # Top every reachable state up with the small areas in greedy order, as far as its leftover budget goes
+    small_weights = np.concatenate(([0.0], np.cumsum(weights[small])))
+    small_values = np.concatenate(([0.0], np.cumsum(values[small])))
+    states = np.flatnonzero(least_cost <= capacity)
+    counts = np.searchsorted(small_weights, capacity - least_cost[states], side="right") - 1
+    best = int(np.argmax(states * scale + small_values[counts]))
+    selected = [int(large[i]) for i in _trace_bits(keep, scaled, int(states[best]))]
+    selected += small[:counts[best]].tolist()
+
+    achieved = values[selected].sum()
+    bound = min(upper, achieved / (1 - epsilon))
+    if integral_values:
+        bound, achieved = math.floor(bound + 1e-9), int(achieved)
+    return sorted(selected, reverse=True), max(0, bound - achieved)
+
+
+def fptas_cells(values, weights, capacity, epsilon):
+    """Number of DP cells knapsack_fptas fills for these areas: its large areas times top + 1 scaled
+    population totals, where top <= 16 / epsilon^2 + 1. Found in O(n log n), before any DP work."""
+    plan = _fptas_plan(np.asarray(values, dtype=np.float64), np.asarray(weights, dtype=np.float64), capacity, epsilon)
+    return 0 if plan is None else len(plan[2]) * (plan[5] + 1)
+
+
+def _trace_back(dp, weights, capacity):
+    """Recovers the selected item indices from a filled (n + 1) x (capacity + 1) DP table."""
+    # Trace back the items included in the optimal solution
+    w = capacity 
+    selected = []  # List to store indices of selected items
+    for i in range(len(dp) - 1, 0, -1):  
+        if dp[i][w] != dp[i - 1][w]:  # If the value changes, the item was included
+            selected.append(i - 1)  # Add the item's index (adjusted for 0-based indexing)
+            w -= weights[i - 1]  # Reduce the remaining capacity by the item's weight
+
+    return selected  # Return the indices of the selected items
+
+
+# Solver engines selectable by name
+ENGINES = {
+    "loop": knapsack_loop,
+    "numpy": knapsack_numpy,
+    "bitset": knapsack_bitset,
+    "pareto": knapsack_pareto,
+    "auto": knapsack_auto,
+    "branch_and_bound": lambda values, weights, capacity, progress=None: knapsack_branch_and_bound(values, weights, capacity)[0],
+    "fptas": lambda values, weights, capacity, progress=None: knapsack_fptas(values, weights, capacity, DEFAULT_EPSILON,
+                                                                             progress)[0],
+}
+# Engines that index the DP by cost and therefore need whole-number costs
+INTEGER_ENGINES = {"loop", "numpy", "bitset", "pareto"}
+DEFAULT_ENGINE = "auto"
+# Error tolerance of the "fptas" engine when it is picked by name
+DEFAULT_EPSILON = 0.01
+
+
+def reduce_costs(weights, capacity):
+    """Divides every cost by the GCD of all costs, and the capacity by the same unit (rounding down).
+    Every reachable total cost is a multiple of the GCD, so the selection is unchanged while the
+    DP table shrinks by that factor. Returns (reduced_weights, reduced_capacity, unit)."""
+    unit = math.gcd(*weights) or 1
+    return [w // unit for w in weights], capacity // unit, unit
+
+
+def knapsack(values, weights, capacity, engine=DEFAULT_ENGINE, progress=None):
+    """Solves the 0/1 Knapsack problem with the named engine and returns the indices of the selected items.
+    If given, progress(rows_done, n) is called after each DP row.
+    Costs and capacity are reduced by their GCD first, so the DP table has one column per cost unit.
+    Fractional costs cannot index a DP table; with the "auto" engine they are solved by branch and bound."""
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown knapsack engine {engine!r}; expected one of {sorted(ENGINES)}")
+    if not all(float(w).is_integer() for w in weights):
+        if engine in INTEGER_ENGINES:
+            raise ValueError(f"The {engine!r} engine needs whole-number costs; use 'branch_and_bound', 'fptas' or 'auto'")
+        if engine == "auto":
+            engine = "branch_and_bound"
+        return ENGINES[engine](values, weights, capacity, progress)
+    weights, capacity, _ = reduce_costs([int(w) for w in weights], int(capacity))
+    return ENGINES[engine](values, weights, capacity, progress)
+
+
+def knapsack_at_resolution(values, weights, capacity, resolution, engine=DEFAULT_ENGINE):
+    """Solves the 0/1 Knapsack problem with costs quantized to multiples of `resolution`.
+    Costs are rounded up, so the selection always fits the real capacity. Solving again with costs
+    rounded down gives an upper bound on the true optimum, from which the worst-case gap is reported.
+    Returns (selected_indices, gap), where gap is the most population the quantization can have lost."""
+    coarse_capacity = capacity // resolution
+    selected = knapsack(values, [-(-w // resolution) for w in weights], coarse_capacity, engine)
+    relaxed = knapsack(values, [w // resolution for w in weights], coarse_capacity, engine)
+    gap = sum(values[i] for i in relaxed) - sum(values[i] for i in selected)
+    return selected, gap
+
+
+def split_bounded(values, weights, counts, marginal_values=None):
+    """Binary splitting for the bounded knapsack, where area i may get up to counts[i] clinics of cost weights[i].
+    The first clinic covers values[i]; each additional one covers marginal_values[i] (default values[i]),
+    which must not be larger, so extra clinics are never chosen without the first. The additional clinics
+    are bundled into 0/1 items of 1, 2, 4, ... clinics, so an area contributes O(log count) items.
+    Returns NumPy arrays (item_values, item_weights, owners, units): the 0/1 items, the area each belongs
+    to and how many clinics it stands for. Items are grouped by area, first clinic first."""
+    values, weights = np.asarray(values), np.asarray(weights)
+    counts = np.asarray(counts, dtype=np.int64)
+    marginal = values if marginal_values is None else np.asarray(marginal_values)
+    bad = np.flatnonzero(marginal > values)
+    if len(bad):
+        area = bad[0]
+        raise ValueError(f"Area {area}: marginal population {marginal[area]} exceeds the first clinic's {values[area]}")
+
+    # One pass per bundle size (1, 2, 4, ...) over all areas that still have clinics left
+    areas = np.flatnonzero(counts >= 1)
+    owners, units = [areas], [np.ones(len(areas), dtype=np.int64)]
+    extra, size = counts[areas] - 1, 1
+    while (left := extra > 0).any():
+        take = np.minimum(size, extra[left])
+        owners.append(areas[left])
+        units.append(take)
+        extra[left] -= take
+        size *= 2
+    owners, units = np.concatenate(owners), np.concatenate(units)
+    order = np.argsort(owners, kind="stable")
+    owners, units = owners[order], units[order]
+
+    first = np.ones(len(owners), dtype=bool)
+    first[1:] = owners[1:] != owners[:-1]
+    item_values = np.where(first, values[owners], marginal[owners] * units)
+    return item_values, weights[owners] * units, owners, units
+
+
+def clinic_counts(selected, owners, units, n):
+    """Number of clinics per area (an int64 array) for the selected items of split_bounded."""
+    selected = np.asarray(selected, dtype=np.intp)
+    return np.bincount(np.asarray(owners)[selected], weights=np.asarray(units)[selected], minlength=n).astype(np.int64)
+
+
+def knapsack_bounded(values, weights, counts, capacity, marginal_values=None, engine=DEFAULT_ENGINE):
+    """Solves the bounded knapsack problem (up to counts[i] clinics per area) via binary splitting.
+    Returns the number of clinics given to each area.
+    Time Complexity: O(sum(log counts[i]) * capacity) with the DP engines."""
+    item_values, item_weights, owners, units = split_bounded(values, weights, counts, marginal_values)
+    return clinic_counts(knapsack(item_values, item_weights, capacity, engine), owners, units, len(values))
+
+
+# The exact multi-constraint DP gives up beyond this many states and the Lagrangian heuristic is used
+MULTI_STATE_LIMIT = 200_000
+
+
+def knapsack_multi(values, weights, capacities, max_states=MULTI_STATE_LIMIT, iterations=200):
+    """Solves the multi-constraint 0/1 Knapsack problem, where weights[i] holds item i's usage of each
+    resource (budget, doctors, equipment, ...) and capacities the matching limits.
+    With whole-number usages it first runs an exact DP over the sparse set of reachable, non-dominated
+    usage vectors, so memory follows the number of states rather than the product of the capacities.
+    When that exceeds max_states (or usages are fractional) it falls back to a Lagrangian relaxation
+    with greedy repair. Returns (selected_indices, gap), where gap bounds the distance to the optimum
+    (0 when solved exactly)."""
+    if all(float(w).is_integer() for row in weights for w in row):
+        try:
+            return _knapsack_multi_exact(values, weights, capacities, max_states), 0
+        except _FrontierTooLarge:
+            pass
+    return _knapsack_multi_lagrangian(values, weights, capacities, iterations)
+
+
+def _knapsack_multi_exact(values, weights, capacities, max_states):
+    d = len(capacities)
+    usage_limit = np.array([int(c) for c in capacities], dtype=np.int64)
+    item_usage = np.array(weights, dtype=np.int64).reshape(len(values), d)
+    usage = np.zeros((1, d), dtype=np.int64)
+    gains = np.zeros(1, dtype=np.int64)
+    parents, took = [], []
+
+    for i, value in enumerate(values):
+        positions = np.arange(len(gains))
+        new_usage = usage + item_usage[i]
+        fits = (new_usage <= usage_limit).all(axis=1) & (item_usage[i] >= 0).all()
+        all_usage = np.concatenate((usage, new_usage[fits]))
+        all_gains = np.concatenate((gains, gains[fits] + value))
+        all_parents = np.concatenate((positions, positions[fits]))
+        all_took = np.concatenate((np.zeros(len(gains), dtype=bool), np.ones(int(fits.sum()), dtype=bool)))
+
+        # Group states by their usage of every resource but the first, order each group by that first
+        # usage with the best value first, and keep a state only if it beats every cheaper one in its group
+        order = np.lexsort((all_took, -all_gains) + tuple(all_usage[:, k] for k in range(d)))
+        sorted_usage, sorted_gains = all_usage[order], all_gains[order]
+        starts = np.ones(len(order), dtype=bool)
+        if d > 1:
+            starts[1:] = (sorted_usage[1:, 1:] != sorted_usage[:-1, 1:]).any(axis=1)
+        span = int(sorted_gains.max() - sorted_gains.min()) + 1
+        groups = np.cumsum(starts) - 1
+        if span * (int(groups[-1]) + 1) < 2 ** 62:
+            # Offsetting each group above the previous one lets a single running max stay within groups
+            shifted = sorted_gains - sorted_gains.min() + groups * span
+            keep = np.ones(len(order), dtype=bool)
+            keep[1:] = shifted[1:] > np.maximum.accumulate(shifted)[:-1]
+        else:
+            # Too many groups to offset safely: only drop states with identical usage
+            keep = np.ones(len(order), dtype=bool)
+            keep[1:] = (sorted_usage[1:] != sorted_usage[:-1]).any(axis=1)
+
+        order = order[keep]
+        usage, gains = sorted_usage[keep], sorted_gains[keep]
+        parents.append(all_parents[order])
+        took.append(all_took[order])
+        if len(gains) > max_states:
+            raise _FrontierTooLarge(len(gains))
+
+    state = int(np.argmax(gains))
+    selected = []
+    for i in range(len(parents) - 1, -1, -1):
+        if took[i][state]:
+            selected.append(i)
+        state = parents[i][state]
+    return selected
+
+
+def _knapsack_multi_lagrangian(values, weights, capacities, iterations):
+    values = np.asarray(values, dtype=float)
+    usage = np.array(weights, dtype=float).reshape(len(values), len(capacities))
+    limits = np.asarray(capacities, dtype=float)
+    eligible = (usage <= limits).all(axis=1) & (usage >= 0).all(axis=1)
+    # Usage as a fraction of each capacity, so that one multiplier scale suits every resource
+    scaled = np.where(eligible[:, None], usage / np.where(limits > 0, limits, 1), 0)
+    integral_values = all(float(v).is_integer() for v in values)
+
+    multipliers = np.zeros(len(limits))
+    best_value, best_selected = 0, []
+    upper = math.inf
+    step, stalled = 2.0, 0
+    for _ in range(iterations):
+        reduced = values - scaled @ multipliers
+        relaxed = eligible & (reduced > 0)
+        # L(multipliers) bounds the optimum from above for any non-negative multipliers
+        bound = multipliers.sum() + reduced[relaxed].sum()
+        if bound < upper - 1e-9:
+            upper, stalled = bound, 0
+        else:
+            stalled += 1
+            if stalled >= 10:
+                step, stalled = step / 2, 0
+
+        # Greedy with repair: take items by value per weighted usage, skipping any that no longer fit
+        price = scaled @ (multipliers + 1 / len(limits))
+        ratio = np.where(price > 0, values / np.where(price > 0, price, 1), math.inf)
+        remaining = limits.copy()
+        selected = []
+        candidates = np.argsort(-ratio, kind="stable")
+        candidates = candidates[eligible[candidates]]
+        while len(candidates):
+            # Take the longest prefix that fits as a whole, skip the item that breaks it, and repeat
+            candidates = candidates[(usage[candidates] <= remaining).all(axis=1)]
+            if not len(candidates):
+                break
+            running = np.cumsum(usage[candidates], axis=0)
+            over = np.flatnonzero((running > remaining).any(axis=1))
+            taken = over[0] if len(over) else len(candidates)
+            selected.extend(candidates[:taken].tolist())
+            remaining -= running[taken - 1] if taken else 0
+            candidates = candidates[taken + 1:]
+        value = values[selected].sum()
+        if value > best_value:
+            best_value, best_selected = value, selected
+
+        subgradient = 1 - scaled[relaxed].sum(axis=0)
+        norm = float(subgradient @ subgradient)
+        if norm == 0 or upper - best_value <= 1e-9:
+            break
+        multipliers = np.maximum(0, multipliers - step * (bound - best_value) / norm * subgradient)
+
+    if integral_values:
+        upper = math.floor(upper + 1e-9)
+    return sorted(best_selected, reverse=True), max(0, upper - best_value)
+
+
+def best_values(values, weights, capacity, progress=None):
+    """Returns the last DP row: the best total value within every capacity 0..capacity (an int64 array, or
+    float64 for fractional values). Only the value row is kept (no traceback bits), so memory is O(capacity)
+    whatever the number of items."""
+    row = np.zeros(capacity + 1, dtype=value_dtype(values))
+    for i in range(len(values)):
+        weight = int(weights[i])
+        if 0 <= weight <= capacity:
+            np.maximum(row[weight:], row[:capacity + 1 - weight] + values[i], out=row[weight:])
+        if progress is not None:
+            progress(i + 1, len(values))
+    return row
+
+
+def merge_curves(curves, capacity):
+    """Splits capacity between groups by max-plus convolution of their best-value curves (a group knapsack).
+    curves[g][b] is group g's best value within budget b; curves may be shorter than capacity + 1 (a group
+    budget cap) and are extended flat. Returns (row, budgets): row[b] is the best total within b, and
+    budgets[g] is the budget given to group g in an optimal split of the full capacity.
+    Time Complexity: O(capacity) per point where a curve increases, as each such point is one shifted np.maximum."""
+    dtype = np.result_type(np.int64, *(np.asarray(curve).dtype for curve in curves))
+    row = np.zeros(capacity + 1, dtype=dtype)
+    choices = np.zeros((len(curves), capacity + 1), dtype=np.int64)
+    for g, curve in enumerate(curves):
+        curve = np.asarray(curve[:capacity + 1], dtype=dtype)
+        merged = row + curve[0]
+        # Spending more on a group only helps at the budgets where its curve steps up
+        for k in np.flatnonzero(np.diff(curve)) + 1:
+            candidate = row[:capacity + 1 - k] + curve[k]
+            better = candidate > merged[k:]
+            merged[k:][better] = candidate[better]
+            choices[g, k:][better] = k
+        row = merged
+
+    budgets = [0] * len(curves)
+    b = capacity
+    for g in range(len(curves) - 1, -1, -1):
+        budgets[g] = int(choices[g, b])
+        b -= budgets[g]
+    return row, budgets
+
+
+def _include(row, weight, value):
+    """Adds one 0/1 item to a best-value row in place (zero-cost items count at every budget)."""
+    if 0 <= weight < len(row):
+        np.maximum(row[weight:], row[:len(row) - weight] + value, out=row[weight:])
+
+
+def forced_values(values, weights, capacity, owners=None, progress=None):
+    """Best total value within capacity with each group of items forced in and forced out, for all groups at once.
+    owners[i] is the group of item i (each item is its own group when None); a group's items must be
+    consecutive, and forcing it in takes its first item while the rest stay optional (as split_bounded lays
+    out an area's clinics). Costs must be whole numbers.
+    Returns (forced_in, forced_out) arrays (int64, or float64 for fractional values) with one entry per
+    group; forced_in is -1 where the first item alone exceeds capacity.
+    A forward pass gives prefix rows P_s (best within every budget using the items before s) and a backward
+    pass suffix rows S_e (the items from e on); a group spanning items s..e-1 is then worth
+    max_b P_s[b] + S_e[capacity - b] forced out, and v_s + max_b P_s[b] + S_(s+1)[capacity - w_s - b] forced in.
+    Only every sqrt(groups)-th prefix row is stored and the others are recomputed block by block on the
+    way back, so memory is O(sqrt(groups) * capacity).
+    Time Complexity: O(n * capacity): three DP passes plus two row sums per group."""
+    if not all(float(w).is_integer() for w in weights):
+        raise ValueError("sensitivity analysis needs whole-number costs")
+    weights, capacity, _ = reduce_costs([int(w) for w in weights], int(capacity))
+    values = np.asarray(values, dtype=value_dtype(values))
+    n = len(values)
+    owners = np.arange(n) if owners is None else np.asarray(owners)
+    starts = np.flatnonzero(np.concatenate(([True], owners[1:] != owners[:-1]))) if n else np.zeros(0, dtype=np.intp)
+    ends = np.append(starts[1:], n)
+    groups = len(starts)
+    forced_in = np.full(groups, -1, dtype=values.dtype)
+    forced_out = np.zeros(groups, dtype=values.dtype)
+    steps = 0
+
+    def step():
+        nonlocal steps
+        steps += 1
+        if progress is not None:
+            progress(steps // 3, n)  # Counted in areas' worth of the three passes
+
+    block = max(1, math.isqrt(groups - 1) + 1) if groups else 1
+    checkpoints = []
+    row = np.zeros(capacity + 1, dtype=values.dtype)
+    for g in range(groups):
+        if g % block == 0:
+            checkpoints.append(row.copy())
+        for i in range(starts[g], ends[g]):
+            _include(row, weights[i], values[i])
+            step()
+
+    suffix = np.zeros(capacity + 1, dtype=values.dtype)
+    for first in range(len(checkpoints) * block - block, -1, -block):
+        # Prefix rows at the starts of this block's groups, recomputed from its checkpoint
+        last = min(first + block, groups)
+        prefixes = [checkpoints[first // block].copy()]
+        for g in range(first, last - 1):
+            prefixes.append(prefixes[-1].copy())
+            for i in range(starts[g], ends[g]):
+                _include(prefixes[-1], weights[i], values[i])
+                step()
+        for g in range(last - 1, first - 1, -1):
+            prefix, s = prefixes[g - first], starts[g]
+            forced_out[g] = (prefix + suffix[::-1]).max()
+            for i in range(ends[g] - 1, s, -1):
+                _include(suffix, weights[i], values[i])
+                step()
+            left = capacity - weights[s]
+            if left >= 0:
+                forced_in[g] = values[s] + (prefix[:left + 1] + suffix[left::-1]).max()
+            _include(suffix, weights[s], values[s])
+            step()
+    return forced_in, forced_out
+
+
+class BudgetSweep:
+    """Solver session holding optimal allocations for every budget up to max_budget.
+    The last DP row holds the best population for each budget, and the packed "took item" bits let
+    any budget's selection be traced back in O(n) without solving again. Appending areas adds one DP
+    row each; changing areas from some position onward recomputes from the nearest checkpoint before it.
+    A sweep is only extended before it is cached; edits to a cached one go through fork(), so readers of
+    a cached sweep never see it change."""
+
+    # A copy of the value row is kept after every this many areas, to restart from when areas change
+    CHECKPOINT_INTERVAL = 128
+
+    def __init__(self, values, weights, max_budget, progress=None):
+        self.max_budget = int(max_budget)
+        self.unit = math.gcd(*(int(w) for w in weights)) or 1
+        self.values, self.weights, self.keep = [], [], []
+        self.row = np.zeros(self.max_budget // self.unit + 1, dtype=value_dtype(values))
+        self.checkpoints = [self.row.copy()]
+        self.extend(values, weights, progress)
+
+    @property
+    def nbytes(self):
+        """Memory held by the value row, checkpoints and "took item" bits."""
+        return self.row.nbytes + sum(c.nbytes for c in self.checkpoints) + sum(k.nbytes for k in self.keep)
+
+    def accepts(self, values, weights):
+        """Whether these areas fit the session: costs all multiples of its cost unit, and populations
+        of the value row's dtype."""
+        return value_dtype(values) == self.row.dtype and all(int(w) % self.unit == 0 for w in weights)
+
+    def extend(self, values, weights, progress=None):
+        """Appends areas, computing one DP row for each. progress(rows_done, rows_total) is called after each row."""
+        for done, (value, cost) in enumerate(zip(values, weights), start=1):
+            weight = int(cost) // self.unit
+            self.keep.append(_add_item(self.row, weight, value))
+            self.values.append(value)
+            self.weights.append(weight)
+            if len(self.values) % self.CHECKPOINT_INTERVAL == 0:
+                self.checkpoints.append(self.row.copy())
+            if progress is not None:
+                progress(done, len(values))
+
+    def fork(self, k):
+        """Returns a new sweep holding this one's first k areas, rebuilding the value row from the nearest
+        checkpoint. The "took item" bits and checkpoints are shared, since neither is modified after it is added."""
+        c = k // self.CHECKPOINT_INTERVAL
+        sweep = copy.copy(self)
+        sweep.values, sweep.weights, sweep.keep = self.values[:k], self.weights[:k], self.keep[:k]
+        sweep.checkpoints = self.checkpoints[:c + 1]
+        sweep.row = self.checkpoints[c].copy()
+        for i in range(c * self.CHECKPOINT_INTERVAL, k):
+            _add_item(sweep.row, self.weights[i], self.values[i])
+        return sweep
+
+    def population(self, budget):
+        """Best total population for a budget; budgets above max_budget are answered at max_budget."""
+        return self.row[min(int(budget), self.max_budget) // self.unit].item()
+
+    def selection(self, budget):
+        """Indices of the areas selected for a budget; budgets above max_budget are answered at max_budget,
+        which sweeps built here set to the total cost of all areas."""
+        return _trace_bits(self.keep, self.weights, min(int(budget), self.max_budget) // self.unit)
+
+    def curve(self):
+        """Returns (budgets, populations) at every budget where the best population increases."""
+        steps = np.flatnonzero(np.diff(self.row)) + 1
+        budgets = np.concatenate(([0], steps, [len(self.row) - 1])) * self.unit
+        populations = np.concatenate(([self.row[0]], self.row[steps], [self.row[-1]]))
+        return budgets, populations
+
+
+# Sweeps are only built when n * (reduced max budget) stays under this many cells
+SWEEP_CELL_LIMIT = 200_000_000
+# Building or extending a sweep by more than this many cells is skipped when the sparse Pareto solve of
+# the single budget is at least SPARSE_ADVANTAGE times cheaper (few areas with large raw costs)
+SWEEP_CHEAP_CELLS = 2_000_000
+SPARSE_ADVANTAGE = 4
+# Least recently used sweeps are evicted beyond this many sessions or this many bytes in total
+SWEEP_CACHE_SIZE = 8
+SWEEP_CACHE_BYTES = 512 * 1024 * 1024
+# Sweep sessions keyed by the (populations, costs) of the area table they currently hold
+_sweeps = OrderedDict()
+# Held only while _sweeps is read or changed; sweeps are built and extended outside it
+sweep_lock = threading.Lock()
+
+
+def sweep_stats():
+    """Number of cached sweep sessions and the bytes they hold."""
+    sessions = list(_sweeps.values())
+    return {"sessions": len(sessions), "bytes": sum(s.nbytes for s in sessions)}
+
+
+def clear_sweeps():
+    """Drops every cached sweep session, so that the next solve starts cold."""
+    with sweep_lock:
+        _sweeps.clear()
+
+
+def _shared_prefix(key, other):
+    """Number of leading areas two (populations, costs) keys have in common."""
+    shared = 0
+    for a, b, c, d in zip(key[0], key[1], other[0], other[1]):
+        if a != c or b != d:
+            break
+        shared += 1
+    return shared
+
+
+def _sparse_is_cheaper(values, weights, capacity, cells):
+    """Whether knapsack_pareto solves this one capacity with at most cells / SPARSE_ADVANTAGE cells' worth
+    of work. The trial stops as soon as the frontier grows past that, so it costs no more than that either."""
+    max_states = cells // (SPARSE_ADVANTAGE * PARETO_STATE_COST * max(len(values), 1))
+    try:
+        knapsack_pareto(values, weights, capacity, max_states=max_states)
+    except _FrontierTooLarge:
+        return False
+    return True
+
+
+def get_budget_sweep(values, weights, budget, build=True, progress=None):
+    """Returns a BudgetSweep covering budget for these areas, reusing a cached one when possible.
+    A session for a table sharing leading areas with this one is forked: only the areas after the first
+    difference are recomputed, so appending an area costs a single DP row. Building runs outside
+    sweep_lock, so sessions for other tables are not held up, and the result replaces the base session.
+    New sweeps run up to the total cost of all areas, beyond which every area is selected anyway
+    (selection() answers larger budgets there).
+    Returns None when the costs are fractional, the sweep would exceed SWEEP_CELL_LIMIT, the sparse
+    solve of this budget is much cheaper than the dense pass (see _sparse_is_cheaper), or build is
+    False and no cached sweep covers the budget."""
+    if not all(float(w).is_integer() for w in weights):
+        return None
+    key = (tuple(values), tuple(int(w) for w in weights))
+    budget = min(int(budget), sum(key[1]))
+    with sweep_lock:
+        sweep = _sweeps.get(key)
+        if sweep is not None and sweep.max_budget >= budget:
+            _sweeps.move_to_end(key)
+            return sweep
+        if not build:
+            return None
+        sessions = list(_sweeps.items())
+
+    # Pick the session sharing the most leading areas with this table
+    base_key, base, shared = None, None, 0
+    for cached_key, cached in sessions:
+        if cached.max_budget >= budget and cached.accepts(values, key[1]):
+            prefix = _shared_prefix(key, cached_key)
+            if prefix > shared:
+                base_key, base, shared = cached_key, cached, prefix
+
+    if base is not None and len(values) * len(base.row) <= SWEEP_CELL_LIMIT:
+        cells = (len(values) - shared) * len(base.row)
+    else:
+        base = None
+        cells = len(values) * (sum(key[1]) // (math.gcd(*key[1]) or 1) + 1)
+        if cells > SWEEP_CELL_LIMIT:
+            return None
+    if cells > SWEEP_CHEAP_CELLS and _sparse_is_cheaper(values, key[1], budget, cells):
+        return None
+
+    if base is not None:
+        sweep = base.fork(shared)
+        sweep.extend(values[shared:], key[1][shared:], progress)
+    else:
+        sweep = BudgetSweep(values, key[1], sum(key[1]), progress)
+
+    with sweep_lock:
+        if base is not None and _sweeps.get(base_key) is base:
+            del _sweeps[base_key]
+        _sweeps[key] = sweep
+        _sweeps.move_to_end(key)
+        while len(_sweeps) > 1 and (len(_sweeps) > SWEEP_CACHE_SIZE or
+                                    sum(s.nbytes for s in _sweeps.values()) > SWEEP_CACHE_BYTES):
+            _sweeps.popitem(last=False)
+    return sweep
+
+
+def solve_budget(values, weights, budget, progress=None):
+    """The exact single-budget solve the app runs for whole-number costs: the selection is traced from the
+    budget sweep when get_budget_sweep returns one, and found by knapsack otherwise.
+    Returns (selected indices, the sweep or None)."""
+    sweep = get_budget_sweep(values, weights, budget, progress=progress)
+    if sweep is not None:
+        return sweep.selection(budget), sweep
+    return knapsack(values, weights, budget, progress=progress), None
@@ -0,0 +1,8 @@
+"""Start-up cost: each IMPORT_BUDGETS statement, timed in fresh interpreters, stays within its budget and
+loads none of the modules it must leave for later."""
+from clinic_alloc.bench import IMPORT_BUDGETS, check_imports, time_import
+
+
+def test_imports_within_budget():
+    imports = {statement: time_import(statement, forbidden) for statement, (_, forbidden) in IMPORT_BUDGETS.items()}
+    assert check_imports(imports) == []
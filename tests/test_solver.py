@@ -0,0 +1,190 @@
+"""Solver checks on seeded random problems: the vectorized engines against the original loop engine, and
+the exact, approximate and grouped solvers against brute force over every subset."""
+from itertools import combinations
+import random
+
+import pytest
+
+from clinic_alloc import regions
+from clinic_alloc.solver import (BudgetSweep, clear_sweeps, forced_values, fptas_cells, knapsack, knapsack_bitset,
+                                 knapsack_branch_and_bound, knapsack_fptas, knapsack_loop, knapsack_multi,
+                                 knapsack_numpy, solve_budget)
+
+
+def random_problem(rng, fractional=False):
+    n = rng.randint(0, 12)
+    values = [rng.randint(0, 100) for _ in range(n)]
+    if fractional:
+        values = [v + rng.choice([0, 0.5, 0.25]) for v in values]
+    weights = [rng.randint(0, 30) for _ in range(n)]
+    return values, weights, rng.randint(0, 80)
+
+
+def total(values, selected):
+    return sum(values[i] for i in selected)
+
+
+def brute_force(values, feasible):
+    """Best total value over the subsets of range(len(values)) (as sorted tuples) for which feasible holds."""
+    n = len(values)
+    return max(total(values, subset) for k in range(n + 1) for subset in combinations(range(n), k) if feasible(subset))
+
+
+@pytest.mark.parametrize("engine", [knapsack_numpy, knapsack_bitset])
+@pytest.mark.parametrize("fractional", [False, True])
+def test_engine_matches_loop(engine, fractional):
+    rng = random.Random(2024)
+    for _ in range(300):
+        values, weights, capacity = random_problem(rng, fractional)
+        expected = knapsack_loop(values, weights, capacity)
+        selected = engine(values, weights, capacity)
+        assert total(values, selected) == total(values, expected)
+        assert sum(weights[i] for i in selected) <= capacity
+        assert len(set(selected)) == len(selected)
+
+
+def test_zero_cost_areas_survive_gcd_reduction():
+    # Reduced by the GCD of 10, the budget is exactly the paid area's cost, so the free area must fit at w = 0
+    values, weights = [13, 22, 37, 2, 26, 30, 34], [10, 0, 150, 80, 20, 130, 170]
+    for engine in ("loop", "numpy", "bitset", "pareto", "auto"):
+        assert sorted(knapsack(values, weights, 23, engine)) == [1, 4]
+
+
+@pytest.mark.parametrize("node_limit", [None, 20])
+def test_branch_and_bound_gap_bounds_brute_force(node_limit):
+    rng = random.Random(5)
+    for _ in range(200):
+        n = rng.randint(0, 10)
+        values = [rng.randint(0, 100) for _ in range(n)]
+        weights = [round(rng.uniform(0, 30), 2) for _ in range(n)]
+        capacity = round(rng.uniform(0, 80), 2)
+        optimum = brute_force(values, lambda s: sum(weights[i] for i in s) <= capacity)
+        selected, gap = knapsack_branch_and_bound(values, weights, capacity, node_limit=node_limit)
+        assert sum(weights[i] for i in selected) <= capacity
+        assert total(values, selected) <= optimum <= total(values, selected) + gap + 1e-9
+        if node_limit is None:
+            assert gap == 0
+
+
+@pytest.mark.parametrize("max_states", [None, 1])
+def test_multi_matches_brute_force(max_states):
+    # max_states=1 forces the Lagrangian fallback, whose gap must still bound the optimum
+    rng = random.Random(14)
+    for _ in range(200):
+        n = rng.randint(1, 10)
+        values = [rng.randint(0, 100) for _ in range(n)]
+        weights = [[rng.randint(0, 30), rng.randint(0, 4), rng.randint(0, 3)] for _ in range(n)]
+        capacities = (rng.randint(0, 80), rng.randint(0, 10), rng.randint(0, 6))
+
+        def fits(s):
+            return all(sum(weights[i][r] for i in s) <= capacities[r] for r in range(3))
+        optimum = brute_force(values, fits)
+        options = {} if max_states is None else {"max_states": max_states}
+        selected, gap = knapsack_multi(values, weights, capacities, **options)
+        assert fits(selected)
+        assert total(values, selected) <= optimum <= total(values, selected) + gap + 1e-9
+        if max_states is None:
+            assert gap == 0
+
+
+@pytest.mark.parametrize("merge_grid", [None, 4])
+def test_regions_match_brute_force(monkeypatch, merge_grid):
+    # A grid of 4 steps splits most budgets coarsely, so the reported gap must cover the rounding
+    if merge_grid is not None:
+        monkeypatch.setattr(regions, "MERGE_GRID", merge_grid)
+    rng = random.Random(15)
+    for _ in range(150):
+        n = rng.randint(1, 10)
+        values = [rng.randint(0, 100) for _ in range(n)]
+        weights = [rng.randint(0, 30) for _ in range(n)]
+        area_regions = [rng.randint(0, 2) for _ in range(n)]
+        budget = rng.randint(0, 80)
+        caps = {region: rng.randint(0, 40) for region in range(3) if rng.random() < 0.5}
+
+        def fits(s):
+            spent = [sum(weights[i] for i in s if area_regions[i] == region) for region in range(3)]
+            return sum(spent) <= budget and all(spent[region] <= cap for region, cap in caps.items())
+
+        optimum = brute_force(values, fits)
+        plan = regions.solve_regions(values, weights, area_regions, budget, caps, parallel=False)
+        assert fits(plan.selected)
+        assert total(values, plan.selected) <= optimum <= total(values, plan.selected) + plan.gap
+        if merge_grid is None:
+            assert total(values, plan.selected) == optimum
+
+
+def test_regions_on_the_process_pool_match_in_process():
+    rng = random.Random(16)
+    values = [rng.randint(0, 1000) for _ in range(60)]
+    weights = [rng.randint(1, 50) for _ in range(60)]
+    area_regions = [i % 4 for i in range(60)]
+    caps = {0: 100, 2: 250}
+    pooled = regions.solve_regions(values, weights, area_regions, 600, caps, parallel=True)
+    local = regions.solve_regions(values, weights, area_regions, 600, caps, parallel=False)
+    assert total(values, pooled.selected) == total(values, local.selected)
+
+
+@pytest.mark.parametrize("epsilon", [0.05, 0.2, 0.5])
+def test_fptas_guarantee_and_gap(epsilon):
+    rng = random.Random(18)
+    for _ in range(200):
+        n = rng.randint(0, 10)
+        values = [rng.randint(0, 100) for _ in range(n)]
+        weights = [round(rng.uniform(0, 30), 2) for _ in range(n)]
+        capacity = round(rng.uniform(0, 80), 2)
+        optimum = brute_force(values, lambda s: sum(weights[i] for i in s) <= capacity)
+        selected, gap = knapsack_fptas(values, weights, capacity, epsilon)
+        assert sum(weights[i] for i in selected) <= capacity
+        assert (1 - epsilon) * optimum <= total(values, selected) <= optimum <= total(values, selected) + gap
+        assert fptas_cells(values, weights, capacity, epsilon) <= n * (16 / epsilon ** 2 + 2)
+
+
+@pytest.mark.parametrize("grouped", [False, True])
+def test_forced_values_match_brute_force(grouped):
+    rng = random.Random(19)
+    for _ in range(200):
+        values, weights, capacity = random_problem(rng)
+        n = len(values)
+        owners = sorted(rng.randint(0, max(n // 2, 1)) for _ in range(n)) if grouped else list(range(n))
+        groups = sorted(set(owners))
+        forced_in, forced_out = forced_values(values, weights, capacity, owners if grouped else None)
+        assert len(forced_in) == len(forced_out) == len(groups)
+
+        def fits(s):
+            return sum(weights[i] for i in s) <= capacity
+
+        for g, group in enumerate(groups):
+            # Forcing a group in takes its first item; forcing it out drops all of its items
+            first = owners.index(group)
+            best_out = brute_force(values, lambda s: fits(s) and all(owners[i] != group for i in s))
+            best_in = -1 if weights[first] > capacity else brute_force(values, lambda s: fits(s) and first in s)
+            assert (forced_in[g], forced_out[g]) == (best_in, best_out)
+
+
+def test_incremental_sweep_matches_loop(monkeypatch):
+    # With a checkpoint every 4 areas, edits and deletions fork the cached sweep from a checkpoint mid-table
+    monkeypatch.setattr(BudgetSweep, "CHECKPOINT_INTERVAL", 4)
+    forks = []
+    fork = BudgetSweep.fork
+    monkeypatch.setattr(BudgetSweep, "fork", lambda sweep, k: forks.append(k) or fork(sweep, k))
+    clear_sweeps()
+    rng = random.Random(7)
+    values = [rng.randint(1, 100) for _ in range(30)]
+    weights = [rng.randint(1, 20) for _ in range(30)]
+    for step in range(90):
+        position = rng.randrange(len(values))
+        if step % 3 == 0:
+            values.append(rng.randint(1, 100))
+            weights.append(rng.randint(1, 20))
+        elif step % 3 == 1:
+            values[position], weights[position] = rng.randint(1, 100), rng.randint(1, 20)
+        else:
+            del values[position], weights[position]
+        budget = rng.randint(0, sum(weights))
+        selected, sweep = solve_budget(values, weights, budget)
+        assert sweep is not None
+        assert sum(weights[i] for i in selected) <= budget
+        assert total(values, selected) == total(values, knapsack_loop(values, weights, budget))
+    clear_sweeps()
+    # Most steps reuse a cached sweep, many of them from between two checkpoints
+    assert len(forks) > 45 and sum(k % 4 != 0 for k in forks) > 20
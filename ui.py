@@ -1,15 +1,46 @@
+import uuid
+
 from dash import dcc, html, dash_table
-import pandas as pd
 
 # Initial data for the areas
 areas = ["Dokki", "New Cairo", "New Giza", "Administrative Capital", "Obour"]
 populations = [500000, 700000, 300000, 800000, 400000]
 costs = [100, 150, 70, 200, 90]
-data = pd.DataFrame({"Area": areas, "Population": populations, "Cost": costs})
+# Large districts may get several clinics, each extra one covering a smaller "marginal" population
+max_clinics = [1, 3, 1, 3, 1]
+marginal_populations = [None, 350000, None, 400000, None]
+# Doctors and equipment units each clinic needs, limited by the optional capacities next to the budget
+doctors = [4, 6, 3, 8, 4]
+equipment = [2, 3, 1, 4, 2]
+# Governorate of each area, used when the budget is split by region
+regions = ["Giza", "Cairo", "Giza", "Cairo", "Qalyubia"]
+COLUMNS = ("Area", "Region", "Population", "Cost", "Max Clinics", "Marginal Population", "Doctors", "Equipment")
+
+
+def default_areas():
+    """The initial area table as a DataFrame; built on first use rather than when the module is imported."""
+    import pandas as pd
+
+    return pd.DataFrame({"Area": areas, "Region": regions, "Population": populations, "Cost": costs,
+                         "Max Clinics": max_clinics,
+                         "Marginal Population": pd.Series(marginal_populations, dtype=object),
+                         "Doctors": doctors, "Equipment": equipment}, columns=list(COLUMNS))
+
+
+# Rows per page of the area and result tables; pages are cut on the server
+PAGE_SIZE = 20
+# Smallest tolerance accepted: the approximation's DP has about 16 / epsilon^2 columns per large area
+MIN_EPSILON = 0.01
 
 # UI Layout
 def create_layout():
     return html.Div([
+        dcc.Store(id="session-id", data=uuid.uuid4().hex),
+        dcc.Interval(id="optimize-poll", interval=500, disabled=True),
+        # Bumped whenever the session's server-side area table or result table changes
+        dcc.Store(id="dataset-version", data=0),
+        dcc.Store(id="results-version", data=0),
+
         html.Div([
             html.Img(src="/assets/logo.png", className="inline-block h-12 mr-4 mt-4"),
             html.H1("Optimize Clinic Locations", 
@@ -21,9 +52,13 @@ def create_layout():
                 html.H3("Areas Data Table", className="text-white text-xl font-semibold mb-4"),
                 dash_table.DataTable(
                     id="input-table",
-                    columns=[{"name": col, "id": col} for col in data.columns],
-                    data=data.to_dict("records"),
+                    columns=[{"name": col, "id": col, "type": "text" if col in ("Area", "Region") else "numeric"}
+                             for col in COLUMNS],
+                    data=[],
                     editable=True,
+                    page_action="custom", page_current=0, page_size=PAGE_SIZE,
+                    sort_action="custom", sort_mode="multi", sort_by=[],
+                    filter_action="custom", filter_query="",
                     style_table={"width": "100%", "borderRadius": "8px", "overflow": "hidden"},
                     style_cell={"textAlign": "center", "color": "#FFFFFF", "backgroundColor": "#1E293B"},
                     style_header={
@@ -40,7 +75,14 @@ def create_layout():
     id="add-area-button",
     n_clicks=0,
     className="bg-blue-500 text-white py-2 px-8 rounded hover:bg-blue-600 mt-4 self-end"
-)
+),
+                dcc.Upload(
+    html.Button("Import CSV", className="bg-blue-500 text-white py-2 px-8 rounded hover:bg-blue-600 mt-4 ml-2"),
+    id="upload-areas",
+    accept=".csv",
+    className="inline-block"
+),
+                html.Span(id="upload-status", className="text-white ml-4")
 
             ], className="w-1/2 inline-block align-top h-70 relative"),
 
@@ -82,12 +124,37 @@ def create_layout():
             html.Label("Enter Budget:", className="text-white mr-4"),
             dcc.Input(id="budget-input", type="number", value=300, min=1, step=1, 
                       className="w-36 p-2 rounded bg-gray-700 text-white mr-4"),
+            html.Label("Tolerance (ε):", className="text-white mr-4"),
+            dcc.Input(id="epsilon-input", type="number", min=MIN_EPSILON, max=0.5, step="any", placeholder="exact",
+                      className="w-36 p-2 rounded bg-gray-700 text-white mr-4"),
+            html.Label("Cost Resolution:", className="text-white mr-4"),
+            dcc.Input(id="cost-resolution-input", type="number", min=1, step=1, placeholder="exact",
+                      className="w-36 p-2 rounded bg-gray-700 text-white mr-4"),
+            html.Label("Doctors:", className="text-white mr-4"),
+            dcc.Input(id="doctors-input", type="number", min=0, step=1, placeholder="no limit",
+                      className="w-36 p-2 rounded bg-gray-700 text-white mr-4"),
+            html.Label("Equipment:", className="text-white mr-4"),
+            dcc.Input(id="equipment-input", type="number", min=0, step=1, placeholder="no limit",
+                      className="w-36 p-2 rounded bg-gray-700 text-white mr-4"),
+            dcc.Checklist(id="region-mode-input", options=[{"label": " Split budget by region", "value": "regions"}],
+                          value=[], className="inline-block text-white mr-4"),
+            dcc.Input(id="region-caps-input", type="text", placeholder="Region caps, e.g. Cairo=200, Giza=150",
+                      className="w-72 p-2 rounded bg-gray-700 text-white mr-4"),
+            dcc.Checklist(id="sensitivity-input", options=[{"label": " Sensitivity analysis", "value": "sensitivity"}],
+                          value=[], className="inline-block text-white mr-4"),
             html.Button(
                 "Optimize Allocation",
                 id="optimize-button",
                 n_clicks=0,
                 className="bg-green-500 text-white py-2 px-4 rounded hover:bg-green-600"
-            )
+            ),
+            html.Button(
+                "Cancel",
+                id="cancel-optimize-button",
+                n_clicks=0,
+                className="bg-red-500 text-white py-2 px-4 rounded hover:bg-red-600 ml-2"
+            ),
+            html.Span(id="optimize-progress", className="text-white ml-4")
         ], className="mt-4 mb-8 text-left"),
 
         html.Div([
@@ -97,11 +164,18 @@ def create_layout():
                     id="output-table",
                     columns=[
                         {"name": "Area", "id": "Area"},
+                        {"name": "Region", "id": "Region"},
                         {"name": "Population", "id": "Population"},
                         {"name": "Cost", "id": "Cost"},
+                        {"name": "Clinics", "id": "Clinics"},
+                        {"name": "Population Served", "id": "Population Served"},
+                        {"name": "Loss If Flipped", "id": "Loss If Flipped"},
                         {"name": "Status", "id": "Status"}
                     ],
                     data=[],
+                    page_action="custom", page_current=0, page_size=PAGE_SIZE,
+                    sort_action="custom", sort_mode="multi", sort_by=[],
+                    filter_action="custom", filter_query="",
                     style_table={"width": "100%", "borderRadius": "8px", "overflow": "hidden"},
                     style_cell={"textAlign": "center", "color": "#FFFFFF", "backgroundColor": "#1E293B"},
                     style_header={
@@ -129,7 +203,30 @@ def create_layout():
     id="total-selected-population",
     className="text-white mt-8 text-2xl font-bold p-4 rounded-lg inline-block",
     style={"border": "2px solid #4CAF50"}
-)
+),
+                html.H3("Allocation by Region", className="text-white text-xl font-semibold mt-8 mb-4"),
+                dash_table.DataTable(
+                    id="region-table",
+                    columns=[
+                        {"name": "Region", "id": "Region"},
+                        {"name": "Cap", "id": "Cap"},
+                        {"name": "Budget", "id": "Budget"},
+                        {"name": "Clinics", "id": "Clinics"},
+                        {"name": "Population Served", "id": "Population Served"},
+                        {"name": "Cost", "id": "Cost"}
+                    ],
+                    data=[],
+                    style_table={"width": "100%", "borderRadius": "8px", "overflow": "hidden"},
+                    style_cell={"textAlign": "center", "color": "#FFFFFF", "backgroundColor": "#1E293B"},
+                    style_header={
+                        "backgroundColor": "#4CAF50",
+                        "color": "white",
+                        "fontWeight": "bold",
+                        "textAlign": "center",
+                        "border": "1px solid #4CAF50"
+                    },
+                    style_data={"border": "1px solid #4CAF50"}
+                )
 
 
             ], className="w-1/2 inline-block align-top"),
@@ -137,7 +234,12 @@ def create_layout():
            html.Div([
     html.H3("Population Contribution", className="text-white text-xl font-semibold mb-4"),
     dcc.Graph(id="population-chart")
-], className="w-2/5 inline-block align-top ml-8 bg-[#001f3f] rounded-lg p-4", style={"border": "2px solid #4CAF50"})
+], className="w-2/5 inline-block align-top ml-8 bg-[#001f3f] rounded-lg p-4", style={"border": "2px solid #4CAF50"}),
+
+           html.Div([
+    html.H3("Population vs. Budget", className="text-white text-xl font-semibold mb-4"),
+    dcc.Graph(id="budget-curve-chart")
+], className="w-2/5 inline-block align-top ml-8 mt-8 bg-[#001f3f] rounded-lg p-4", style={"border": "2px solid #4CAF50"})
 
         ])
     ], className="bg-gray-800 p-8")